@@ -1,23 +1,101 @@
+import asyncio
+import logging
+import time
 import uuid
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Set, Tuple
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
-from .config import FRONTEND_DIR, GENERATED_DIR
-from .llm_client import OpenAIChatLLM
-from .models import CharacterTraits
-from .services.gameplay import GalGameAgent, dynamic_update, generate_blueprint, roleplay_turn
+from .config import FRONTEND_DIR, settings
+from .llm_router import build_role_llm
+from .models import CharacterTraits, Node
+from .services.catalog import WORLD_CATALOG
+from .services.gameplay import (
+    UPDATE_COUNTERS,
+    GalGameAgent,
+    dynamic_update,
+    fused_turn,
+    generate_blueprint,
+    roleplay_turn,
+)
 from .services.images import generate_final_cg, generate_portrait, generate_scene_image
+from .services.media import MEDIA_STORE, SESSION_ID_RE
+from .services.realtime import EventHub, GameConnection, spawn, split_dialogue
+from .services.similarity import SCENE_INDEX
 from .services.state import blueprint_list, load_state, state_from_agent
+from .services.tokens import SESSION_CODEC, SessionTokenError, check_session_mode
+from .telemetry import (
+    MEDIA_LOGGER,
+    TurnTrace,
+    log_event,
+    record_transcript,
+    session_scope,
+    start_logging,
+    stop_logging,
+    trace_turn,
+    transcript_path,
+)
 
 
 MEDIA_ROUTE = "/media"
 
-app = FastAPI(title="GalGame Agent API")
+
+def _expire_sessions(now: float) -> None:
+    ttl = settings.session_ttl_hours * 3600
+    if ttl <= 0:
+        return
+    for session_id in [sid for sid, s in SESSIONS.items() if now - s.get("last_played", now) > ttl]:
+        SESSIONS.pop(session_id, None)
+        HUB.drop(session_id)
+
+
+async def _media_gc_loop() -> None:
+    while True:
+        await asyncio.sleep(settings.media_gc_interval)
+        now = time.time()
+        _expire_sessions(now)
+        try:
+            # 仍持有的会话都不回收，配额只淘汰无主（已过期或 token 模式下不在本 worker）的图片
+            report = await asyncio.to_thread(MEDIA_STORE.collect, set(SESSIONS) | set(HUB.connections), now)
+            pruned = await asyncio.to_thread(SCENE_INDEX.compact) if report.evicted_sessions else 0
+        except OSError as e:
+            log_event(MEDIA_LOGGER, "media_gc_failed", {"error": repr(e)}, logging.WARNING)
+            continue
+        for session_id in report.evicted_sessions:
+            HUB.drop(session_id)
+        if report.evicted_sessions:
+            log_event(MEDIA_LOGGER, "media_gc", {**report.to_dict(), "scene_index_pruned": pruned})
+
+
+async def _event_log_gc_loop() -> None:
+    interval = min(60.0, settings.ws_event_log_idle / 2)
+    while True:
+        await asyncio.sleep(interval)
+        HUB.expire(settings.ws_event_log_idle)
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    start_logging()
+    log_event(MEDIA_LOGGER, "catalog_loaded", {"worlds": WORLD_CATALOG.load(), "dir": str(WORLD_CATALOG.root)})
+    gc_tasks = [asyncio.create_task(_event_log_gc_loop())] if settings.ws_event_log_idle > 0 else []
+    if settings.media_gc_interval > 0:
+        gc_tasks.append(asyncio.create_task(_media_gc_loop()))
+    try:
+        yield
+    finally:
+        for task in gc_tasks:
+            task.cancel()
+        stop_logging()
+
+
+app = FastAPI(title="GalGame Agent API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,7 +105,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.mount(MEDIA_ROUTE, StaticFiles(directory=str(GENERATED_DIR)), name="media")
 if FRONTEND_DIR.exists():
     app.mount("/app", StaticFiles(directory=str(FRONTEND_DIR), html=True), name="frontend")
 
@@ -40,44 +117,155 @@ class GameInitRequest(BaseModel):
 class GameActionRequest(BaseModel):
     session_id: str
     user_input: str
+    # GALGAME_SESSION_MODE=token 时由客户端回传上一次响应中的 session_token
+    session_token: Optional[str] = None
 
 
 SESSIONS: Dict[str, Dict[str, Any]] = {}
 
-LLM1 = OpenAIChatLLM()
-LLM2 = OpenAIChatLLM()
-LLM3 = OpenAIChatLLM()
+LLM1 = build_role_llm("llm1")
+LLM2 = build_role_llm("llm2")
+LLM3 = build_role_llm("llm3")
+
+HUB = EventHub(settings.ws_event_log_size)
+TURN_TASKS: Set["asyncio.Task[Any]"] = set()
+ASSET_TASKS: Set["asyncio.Task[Any]"] = set()
+# (session_id, node_id) -> 最近一次为该节点排队的后台渲染，同一节点的渲染串行执行，避免重复调用生图
+RENDER_TASKS: Dict[Tuple[str, str], "asyncio.Task[Any]"] = {}
+
+
+check_session_mode(settings.session_mode, SESSION_CODEC)
+TOKEN_MODE = settings.session_mode == "token"
+
+
+def _lookup_session(session_id: str, token: Optional[str]) -> Dict[str, Any]:
+    session = SESSIONS.get(session_id)
+    if session is not None:
+        return session
+    if TOKEN_MODE and token:
+        try:
+            token_session_id, session = SESSION_CODEC.decode(token)
+        except SessionTokenError as e:
+            raise HTTPException(status_code=401, detail=str(e)) from e
+        if token_session_id != session_id:
+            raise HTTPException(status_code=401, detail="会话令牌与 session_id 不匹配")
+        portrait = session.get("portrait_path")
+        if portrait and not Path(portrait).is_file():
+            # 图片已被过期/配额回收，继续游玩只会得到失效的图片链接和失去参考图的场景
+            raise HTTPException(status_code=404, detail="Session not found")
+        return session
+    raise HTTPException(status_code=404, detail="Session not found")
+
+
+def _issue_token(session_id: str, session: Dict[str, Any]) -> str:
+    try:
+        return SESSION_CODEC.encode(session_id, session)
+    except SessionTokenError as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+def _ws_token(session_id: str, session: Dict[str, Any]) -> Optional[str]:
+    """WS 通道签发令牌；失败时单独推送错误事件，不影响本轮结果。"""
+    try:
+        return SESSION_CODEC.encode(session_id, session)
+    except SessionTokenError as e:
+        HUB.publish(session_id, "error", {"detail": f"会话令牌签发失败: {e}"})
+        return None
 
 
 def _url_for_path(path: Path) -> str:
     return f"{MEDIA_ROUTE}/{path.name}"
 
 
-@app.post("/api/v1/game/start")
-async def start_game(req: GameInitRequest) -> Dict[str, Any]:
-    session_id = uuid.uuid4().hex
-    agent = GalGameAgent(LLM1, LLM2, LLM3)
-    worldbook = await generate_blueprint(agent, req.role_desc, req.world_desc or "")
-    traits = worldbook.traits
-
-    portrait: Optional[Path] = generate_portrait(traits, session_id)
-    char_url = _url_for_path(portrait) if portrait and portrait.exists() else ""
+def _asset_manifest(session_id: str, session: Dict[str, Any]) -> Dict[str, Any]:
+    scene_urls = {
+        node_id: _url_for_path(Path(p)) for node_id, p in (session.get("scene_paths") or {}).items() if p
+    }
+    urls = [session.get("char_url", ""), *scene_urls.values(), session.get("final_cg_url", "")]
+    return {
+        "session_id": session_id,
+        "char_url": session.get("char_url", ""),
+        "scene_url": session.get("scene_url", ""),
+        "scenes": scene_urls,
+        "final_cg_url": session.get("final_cg_url", ""),
+        "urls": list(dict.fromkeys(u for u in urls if u)),
+    }
 
-    node = worldbook.blueprint.nodes[agent.current_node_id]  # type: ignore[index]
-    scene_path = generate_scene_image(session_id, portrait, traits, node)
-    scene_url = _url_for_path(scene_path) if scene_path and scene_path.exists() else ""
 
-    SESSIONS[session_id] = {
-        "state": state_from_agent(agent),
-        "char_url": char_url,
-        "scene_url": scene_url,
-        "bg_url": scene_url,
-        "final_cg_url": "",
-        "portrait_path": portrait.as_posix() if portrait else "",
-        "scene_paths": {node.id: scene_path.as_posix()} if scene_path else {},
+def _resync_state(session_id: str, session: Dict[str, Any]) -> Dict[str, Any]:
+    """断线缺口无法靠事件补齐时下发的完整状态。"""
+    state = session["state"]
+    data = {
+        **_asset_manifest(session_id, session),
+        "affection": state.get("affection"),
+        "current_node_id": state.get("current_node_id"),
+        "options": list(state.get("pending_options") or {}),
     }
+    if TOKEN_MODE:
+        data["session_token"] = _ws_token(session_id, session)
+    return data
 
-    return {
+
+@app.post("/api/v1/game/start")
+async def start_game(req: GameInitRequest) -> Dict[str, Any]:
+    session_id = uuid.uuid4().hex
+    with trace_turn(session_id, "start") as trace:
+        agent = GalGameAgent(LLM1, LLM2, LLM3)
+        portrait: Optional[Path]
+        scene_paths: Dict[str, Path] = {}
+        world = WORLD_CATALOG.lookup(req.role_desc, req.world_desc or "")
+        if world is not None:
+            # 命中离线预生成的世界：跳过 LLM1 与生图，直接链接立绘和全部节点场景
+            load_state(agent, world.state)
+            assert agent.worldbook is not None
+            worldbook = agent.worldbook
+            portrait, scene_paths = await asyncio.to_thread(WORLD_CATALOG.materialize, world, session_id)
+        else:
+            worldbook = await generate_blueprint(agent, req.role_desc, req.world_desc or "")
+            portrait = await asyncio.to_thread(generate_portrait, worldbook.traits, session_id)
+        traits = worldbook.traits
+        char_url = _url_for_path(portrait) if portrait and portrait.exists() else ""
+
+        node = worldbook.blueprint.nodes[agent.current_node_id]  # type: ignore[index]
+        scene_path = scene_paths.get(node.id)
+        if scene_path is None:
+            scene_path = await asyncio.to_thread(generate_scene_image, session_id, portrait, traits, node)
+        scene_url = _url_for_path(scene_path) if scene_path and scene_path.exists() else ""
+        if scene_path:
+            scene_paths[node.id] = scene_path
+
+        session = {
+            "state": state_from_agent(agent),
+            "char_url": char_url,
+            "scene_url": scene_url,
+            "bg_url": scene_url,
+            "final_cg_url": "",
+            "portrait_path": portrait.as_posix() if portrait else "",
+            "scene_paths": {node_id: p.as_posix() for node_id, p in scene_paths.items()},
+            "rev": 0,
+            "last_played": time.time(),
+        }
+        if not TOKEN_MODE:
+            SESSIONS[session_id] = session
+        trace.update(
+            node_id=agent.current_node_id,
+            affection=agent.affection,
+            node_count=len(worldbook.blueprint.nodes),
+            has_portrait=bool(char_url),
+            has_scene=bool(scene_url),
+            catalog=world is not None,
+        )
+        record_transcript(
+            session_id,
+            {
+                "kind": "start",
+                "role_desc": req.role_desc,
+                "world_desc": req.world_desc or "",
+                "opening": worldbook.opening_line,
+            },
+        )
+
+    response = {
         "session_id": session_id,
         "opening": worldbook.opening_line,
         "char_url": char_url,
@@ -92,62 +280,351 @@ async def start_game(req: GameInitRequest) -> Dict[str, Any]:
         "affection": agent.affection,
         "current_node_id": agent.current_node_id,
     }
+    if TOKEN_MODE:
+        response["session_token"] = _issue_token(session_id, session)
+    return response
 
 
-@app.post("/api/v1/game/chat")
-async def chat(req: GameActionRequest) -> Dict[str, Any]:
-    if req.session_id not in SESSIONS:
-        raise HTTPException(status_code=404, detail="Session not found")
-
-    session = SESSIONS[req.session_id]
-    portrait = Path(session.get("portrait_path", "")) if session.get("portrait_path") else None
-    scene_paths: Dict[str, str] = dict(session.get("scene_paths") or {})
+def _load_agent(session: Dict[str, Any]) -> GalGameAgent:
     agent = GalGameAgent(LLM1, LLM2, LLM3)
     load_state(agent, session["state"])
+    return agent
 
-    affection, current_node_id, logic_reason, node_ext = await dynamic_update(
-        agent, agent.affection, agent.current_node_id, req.user_input  # type: ignore[arg-type]
+
+def _save_agent(session: Dict[str, Any], agent: GalGameAgent) -> None:
+    session["state"] = state_from_agent(agent)
+    session["rev"] = session.get("rev", 0) + 1
+    session["last_played"] = time.time()
+
+
+def _portrait(session: Dict[str, Any]) -> Optional[Path]:
+    return Path(session["portrait_path"]) if session.get("portrait_path") else None
+
+
+async def _advance(
+    agent: GalGameAgent,
+    user_input: str,
+    on_director: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+) -> Dict[str, Any]:
+    if settings.turn_mode == "fused":
+        director, rp = await fused_turn(agent, agent.affection, agent.current_node_id, user_input)  # type: ignore[arg-type]
+    else:
+        director = await dynamic_update(agent, agent.affection, agent.current_node_id, user_input)  # type: ignore[arg-type]
+        rp = None
+    affection, current_node_id, logic_reason, node_ext = director
+    story: Dict[str, Any] = {
+        "affection": affection,
+        "current_node_id": current_node_id,
+        "logic_reason": logic_reason,
+        "node_extension": node_ext,
+        "update_source": agent.last_update_source,
+    }
+    if on_director is not None:
+        await on_director(story)
+
+    if rp is None:
+        rp = await roleplay_turn(agent, affection, current_node_id, user_input)
+    story.update(
+        {
+            "dialogue": rp.get("dialogue", ""),
+            "expression": rp.get("expression", ""),
+            "movement": rp.get("movement", ""),
+            "options": [rp.get("option_a", ""), rp.get("option_b", "")],
+        }
     )
+    return story
+
+
+def _current_node(agent: GalGameAgent) -> Node:
+    return agent.worldbook.blueprint.nodes[agent.current_node_id]  # type: ignore[union-attr,index]
 
-    rp = await roleplay_turn(agent, affection, current_node_id, req.user_input)
 
-    node = agent.worldbook.blueprint.nodes[current_node_id]  # type: ignore[union-attr]
-    scene_url = session.get("scene_url", "")
-    existing_scene_path = Path(scene_paths.get(node.id, "")) if scene_paths.get(node.id) else None
-    if not existing_scene_path or not existing_scene_path.exists():
-        existing_scene_path = generate_scene_image(req.session_id, portrait, agent.worldbook.traits, node)  # type: ignore[arg-type]
-    if existing_scene_path and existing_scene_path.exists():
-        scene_paths[node.id] = existing_scene_path.as_posix()
-        scene_url = _url_for_path(existing_scene_path)
+def _cached_scene(session: Dict[str, Any], node_id: str) -> Optional[Path]:
+    existing = (session.get("scene_paths") or {}).get(node_id)
+    if existing and Path(existing).exists():
+        return Path(existing)
+    return None
 
+
+def _ensure_scene(session_id: str, session: Dict[str, Any], traits: CharacterTraits, node: Node) -> str:
+    scene_path = _cached_scene(session, node.id)
+    if scene_path is None:
+        scene_path = generate_scene_image(session_id, _portrait(session), traits, node)
+    if scene_path and scene_path.exists():
+        _record_scene(session, node.id, scene_path)
+    return session.get("scene_url", "")
+
+
+def _record_scene(session: Dict[str, Any], node_id: str, scene_path: Path) -> str:
+    scene_paths: Dict[str, str] = dict(session.get("scene_paths") or {})
+    scene_paths[node_id] = scene_path.as_posix()
+    session["scene_paths"] = scene_paths
+    scene_url = _url_for_path(scene_path)
+    session["scene_url"] = scene_url
+    session["bg_url"] = scene_url
+    return scene_url
+
+
+def _ensure_final_cg(
+    session_id: str, session: Dict[str, Any], traits: CharacterTraits, node: Node, affection: int
+) -> str:
     final_cg_url = session.get("final_cg_url", "")
     if affection >= 100 and not final_cg_url:
-        maybe_cg = generate_final_cg(req.session_id, agent.worldbook.traits, node, portrait)  # type: ignore[arg-type]
+        maybe_cg = generate_final_cg(session_id, traits, node, _portrait(session))
         if maybe_cg and maybe_cg.exists():
             final_cg_url = _url_for_path(maybe_cg)
+            session["final_cg_url"] = final_cg_url
+    return final_cg_url
 
-    session["state"] = state_from_agent(agent)
-    session["scene_url"] = scene_url
-    session["bg_url"] = scene_url
-    session["scene_paths"] = scene_paths
-    session["final_cg_url"] = final_cg_url
 
+def _turn_response(session: Dict[str, Any], story: Dict[str, Any]) -> Dict[str, Any]:
     return {
-        "dialogue": rp.get("dialogue", ""),
-        "expression": rp.get("expression", ""),
-        "movement": rp.get("movement", ""),
-        "options": [rp.get("option_a", ""), rp.get("option_b", "")],
-        "affection": affection,
-        "current_node_id": current_node_id,
-        "scene_url": scene_url,
-        "bg_url": scene_url,
+        "dialogue": story.get("dialogue", ""),
+        "expression": story.get("expression", ""),
+        "movement": story.get("movement", ""),
+        "options": story.get("options", ["", ""]),
+        "affection": story["affection"],
+        "current_node_id": story["current_node_id"],
+        "scene_url": session.get("scene_url", ""),
+        "bg_url": session.get("scene_url", ""),
         "char_url": session.get("char_url", ""),
-        "logic_reason": logic_reason,
-        "node_extension": node_ext,
-        "final_cg_url": final_cg_url,
+        "logic_reason": story.get("logic_reason", ""),
+        "node_extension": story.get("node_extension", {}),
+        "final_cg_url": session.get("final_cg_url", ""),
+    }
+
+
+def _log_turn(trace: TurnTrace, session_id: str, user_input: str, story: Dict[str, Any]) -> None:
+    trace.update(
+        node_id=story["current_node_id"],
+        affection=story["affection"],
+        custom_node=bool(story.get("node_extension")),
+        update_source=story.get("update_source", ""),
+        input_chars=len(user_input),
+        dialogue_chars=len(story.get("dialogue", "")),
+    )
+    record_transcript(
+        session_id,
+        {
+            "kind": "turn",
+            "user_input": user_input,
+            **{k: story.get(k) for k in ("dialogue", "expression", "movement", "options", "logic_reason")},
+            "affection": story["affection"],
+            "current_node_id": story["current_node_id"],
+        },
+    )
+
+
+@app.post("/api/v1/game/chat")
+async def chat(req: GameActionRequest) -> Dict[str, Any]:
+    session = _lookup_session(req.session_id, req.session_token)
+    MEDIA_STORE.touch(req.session_id)
+    with trace_turn(req.session_id, "http") as trace:
+        agent = _load_agent(session)
+        story = await _advance(agent, req.user_input)
+        _log_turn(trace, req.session_id, req.user_input, story)
+        traits = agent.worldbook.traits  # type: ignore[union-attr]
+        node = _current_node(agent)
+        await _wait_render(req.session_id, node.id)
+        await asyncio.to_thread(_ensure_scene, req.session_id, session, traits, node)
+        await asyncio.to_thread(_ensure_final_cg, req.session_id, session, traits, node, agent.affection)
+        _save_agent(session, agent)
+    response = _turn_response(session, story)
+    if TOKEN_MODE:
+        response["session_token"] = _issue_token(req.session_id, session)
+    return response
+
+
+async def _wait_render(session_id: str, node_id: str) -> None:
+    running = RENDER_TASKS.get((session_id, node_id))
+    if running is not None and not running.done():
+        await asyncio.wait([running])
+
+
+def _schedule_render(
+    session_id: str, session: Dict[str, Any], traits: CharacterTraits, node: Node, affection: int
+) -> "asyncio.Task[Any]":
+    """同一节点已有渲染在途时排在其后执行：届时场景已缓存，只补做终局 CG 判断。"""
+    key = (session_id, node.id)
+    # 在登记新任务前取出旧任务，否则新任务会等待自己
+    previous = RENDER_TASKS.get(key)
+
+    async def chained() -> None:
+        if previous is not None and not previous.done():
+            await asyncio.wait([previous])
+        await _render_assets(session_id, session, traits, node, affection)
+
+    task = spawn(chained(), ASSET_TASKS)
+    RENDER_TASKS[key] = task
+
+    def forget(done: "asyncio.Task[Any]") -> None:
+        if RENDER_TASKS.get(key) is done:
+            RENDER_TASKS.pop(key, None)
+
+    task.add_done_callback(forget)
+    return task
+
+
+async def _render_assets(
+    session_id: str, session: Dict[str, Any], traits: CharacterTraits, node: Node, affection: int
+) -> None:
+    with session_scope(session_id):
+        await _render_assets_for_session(session_id, session, traits, node, affection)
+
+
+async def _render_assets_for_session(
+    session_id: str, session: Dict[str, Any], traits: CharacterTraits, node: Node, affection: int
+) -> None:
+    try:
+        if _cached_scene(session, node.id) is None:
+            await asyncio.to_thread(_ensure_scene, session_id, session, traits, node)
+            scene_path = _cached_scene(session, node.id)
+            if scene_path is not None:
+                url = _url_for_path(scene_path)
+                HUB.publish(session_id, "asset", {"kind": "scene", "node_id": node.id, "url": url})
+        had_cg = bool(session.get("final_cg_url"))
+        final_cg_url = await asyncio.to_thread(_ensure_final_cg, session_id, session, traits, node, affection)
+        if final_cg_url and not had_cg:
+            HUB.publish(session_id, "asset", {"kind": "final_cg", "node_id": node.id, "url": final_cg_url})
+    except Exception as e:  # noqa: BLE001
+        HUB.publish(session_id, "error", {"detail": f"图像生成失败: {e}"})
+    if TOKEN_MODE:
+        token = _ws_token(session_id, session)
+        if token is not None:
+            HUB.publish(session_id, "token", {"session_token": token})
+
+
+@app.websocket("/api/v1/game/ws/{session_id}")
+async def game_socket(websocket: WebSocket, session_id: str, last_seq: int = 0, token: str = "") -> None:
+    # 先 accept 再关闭：握手前关闭会变成 HTTP 403，浏览器只能看到 1006，收不到 44xx
+    await websocket.accept()
+    try:
+        session = _lookup_session(session_id, token)
+    except HTTPException as e:
+        await websocket.close(code=4000 + e.status_code, reason=str(e.detail))
+        return
+    # token 模式下会话仅在连接期间驻留本 worker
+    owned = session_id not in SESSIONS
+    SESSIONS.setdefault(session_id, session)
+    conn = GameConnection(
+        websocket,
+        session_id,
+        HUB,
+        send_buffer=settings.ws_send_buffer,
+        heartbeat_interval=settings.ws_heartbeat_interval,
+        heartbeat_timeout=settings.ws_heartbeat_timeout,
+    )
+    # 连接期间保持解析后的会话常驻，仅在 HTTP 通道改写过状态时重新加载
+    hot = {"agent": _load_agent(SESSIONS[session_id]), "rev": SESSIONS[session_id].get("rev", 0), "turn": None}
+
+    async def publish_director(story: Dict[str, Any]) -> None:
+        HUB.publish(session_id, "state", dict(story))
+
+    async def play(user_input: str) -> None:
+        session = SESSIONS.get(session_id)
+        if session is None:
+            conn.close(4404, "Session not found")
+            return
+        if session.get("rev", 0) != hot["rev"]:
+            hot["agent"] = _load_agent(session)
+        agent: GalGameAgent = hot["agent"]
+        MEDIA_STORE.touch(session_id)
+        with trace_turn(session_id, "ws") as trace:
+            try:
+                story = await _advance(agent, user_input, on_director=publish_director)
+            except Exception as e:  # noqa: BLE001
+                # 失败的一轮不落盘，下一轮从会话中的最新状态重新加载
+                trace.error = repr(e)
+                hot["rev"] = -1
+                HUB.publish(session_id, "error", {"detail": str(e)})
+                return
+            _log_turn(trace, session_id, user_input, story)
+        chunks = split_dialogue(story.get("dialogue", ""))
+        for idx, chunk in enumerate(chunks):
+            HUB.publish(session_id, "dialogue", {"index": idx, "text": chunk, "final": idx == len(chunks) - 1})
+        _save_agent(session, agent)
+        hot["rev"] = session["rev"]
+        node = _current_node(agent)
+        # 已有场景图（回到旧阶段、预生成世界）时立即切换背景，未生成的交给后台渲染后以 asset 事件推送
+        cached = _cached_scene(session, node.id)
+        if cached is not None:
+            _record_scene(session, node.id, cached)
+        response = _turn_response(session, story)
+        if TOKEN_MODE:
+            response["session_token"] = _ws_token(session_id, session)
+        HUB.publish(session_id, "turn", response)
+        traits = agent.worldbook.traits  # type: ignore[union-attr]
+        _schedule_render(session_id, session, traits, node, agent.affection)
+
+    async def on_message(msg: Dict[str, Any]) -> None:
+        if msg.get("type") != "input" or not str(msg.get("user_input", "")).strip():
+            conn.push({"type": "error", "data": {"detail": "未知消息类型或输入为空"}})
+            return
+        running = hot["turn"]
+        if running is not None and not running.done():
+            conn.push({"type": "error", "data": {"detail": "上一轮尚未结束"}})
+            return
+        hot["turn"] = spawn(play(str(msg["user_input"])), TURN_TASKS)
+
+    try:
+        await conn.serve(
+            on_message,
+            last_seq=last_seq,
+            resync=lambda: _resync_state(session_id, SESSIONS.get(session_id, session)),
+        )
+    finally:
+        if owned and session_id not in HUB.connections:
+            SESSIONS.pop(session_id, None)
+
+
+@app.get(MEDIA_ROUTE + "/{filename}", name="media")
+async def media(filename: str) -> FileResponse:
+    path = MEDIA_STORE.resolve(filename)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return FileResponse(path)
+
+
+@app.get("/api/v1/game/{session_id}/assets")
+async def session_assets(session_id: str, token: str = "") -> Dict[str, Any]:
+    return _asset_manifest(session_id, _lookup_session(session_id, token))
+
+
+@app.get("/api/v1/game/{session_id}/transcript")
+async def session_transcript(session_id: str, token: str = "") -> FileResponse:
+    if settings.transcript_dir is None:
+        raise HTTPException(status_code=404, detail="Transcript export disabled")
+    # 与 /assets 相同的校验：token 模式须带有效令牌，内存模式须为未过期的会话
+    _lookup_session(session_id, token)
+    path = transcript_path(session_id) if SESSION_ID_RE.fullmatch(session_id) else None
+    if path is None or not path.exists():
+        raise HTTPException(status_code=404, detail="Transcript not found")
+    return FileResponse(path, media_type="application/gzip", filename=path.name)
+
+
+@app.get("/api/v1/stats/llm")
+async def llm_stats() -> Dict[str, Any]:
+    return {"roles": [llm.snapshot() for llm in (LLM1, LLM2, LLM3)]}
+
+
+@app.get("/api/v1/stats/turns")
+async def turn_stats() -> Dict[str, Any]:
+    option, director, fused = UPDATE_COUNTERS["option"], UPDATE_COUNTERS["director"], UPDATE_COUNTERS["fused"]
+    total = option + director + fused
+    return {
+        "turn_mode": settings.turn_mode,
+        "option_fast_path": option,
+        "director_calls": director,
+        "fused_calls": fused,
+        "fast_path_rate": round(option / total, 4) if total else 0.0,
     }
 
 
+@app.get("/api/v1/stats/scenes")
+async def scene_stats() -> Dict[str, Any]:
+    return SCENE_INDEX.snapshot()
+
+
 @app.get("/health")
 async def health() -> Dict[str, str]:
     return {"status": "ok"}
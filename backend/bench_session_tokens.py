@@ -0,0 +1,98 @@
+"""测量会话令牌每轮的编码/解码开销与体积。
+
+默认使用一份五节点、中文长文本的合成会话；也可用 --state 指定 state_from_agent 导出的 JSON。
+
+    python -m galgame_app.backend.bench_session_tokens --iterations 2000
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from .llm_router import percentile
+from .services.tokens import SessionTokenCodec, parse_keys
+
+
+def _synthetic_state() -> Dict[str, Any]:
+    detail = "雨夜的老街餐馆里，她擦着吧台，一边抱怨客人太少，一边偷偷给你多盛了一勺汤。" * 4
+    nodes = [
+        {
+            "ID": i,
+            "label": f"第{i}章",
+            "details": detail,
+            "scene": "黄昏的老街，暖色灯笼与湿漉漉的石板路",
+            "affection_threshold": t,
+        }
+        for i, t in zip(range(1, 6), (0, 31, 51, 76, 91))
+    ]
+    return {
+        "worldbook": {
+            "角色特征": {
+                "名字": "林小满",
+                "外貌": "齐肩黑发，围裙上沾着面粉，眼睛笑起来弯成月牙" * 2,
+                "性格": {k: "嘴硬心软，对熟客格外照顾" * 3 for k in ("[0-30]", "[31-50]", "[51-75]", "[76-90]", "[91-100]")},
+                "背景设定": "继承了外婆的小餐馆，正面临拆迁压力" * 5,
+                "好感度": 15,
+            },
+            "世界观": "现代都市中即将被改造的老街区" * 5,
+            "开场白": "欢迎光临……又是你啊。",
+            "剧本蓝图": {"node": nodes},
+        },
+        "affection": 42,
+        "current_node_id": "2",
+        "pending_options": {"帮她收拾桌子": {"affection_delta": 5, "stage_effect": "拉近距离"}},
+    }
+
+
+def _session(state: Dict[str, Any]) -> Dict[str, Any]:
+    sid = "0" * 32
+    return {
+        "state": state,
+        "char_url": f"/media/portrait_{sid}_0.png",
+        "scene_url": f"/media/scene_{sid}_node_2_0.png",
+        "final_cg_url": "",
+        "portrait_path": f"generated/00/{sid}/portrait_{sid}_0.png",
+        "scene_paths": {str(i): f"generated/00/{sid}/scene_{sid}_node_{i}_0.png" for i in range(1, 3)},
+        "rev": 7,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="会话令牌编解码基准")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--state", type=Path, help="可选：state_from_agent 导出的 JSON 文件")
+    args = parser.parse_args()
+
+    state = json.loads(args.state.read_text(encoding="utf-8")) if args.state else _synthetic_state()
+    session = _session(state)
+    codec = SessionTokenCodec(parse_keys("bench:bench-secret"), max_bytes=1 << 20, ttl_seconds=0)
+    session_id = "0" * 32
+
+    encode_us: List[float] = []
+    decode_us: List[float] = []
+    token = ""
+    for _ in range(args.iterations):
+        started = time.perf_counter()
+        token = codec.encode(session_id, session)
+        encode_us.append((time.perf_counter() - started) * 1e6)
+        started = time.perf_counter()
+        codec.decode(token)
+        decode_us.append((time.perf_counter() - started) * 1e6)
+
+    raw_bytes = len(json.dumps(session, ensure_ascii=False).encode("utf-8"))
+    report = {
+        "iterations": args.iterations,
+        "session_json_bytes": raw_bytes,
+        "token_bytes": len(token),
+        "ratio": round(len(token) / raw_bytes, 3),
+        "encode_p50_us": round(percentile(encode_us, 50), 1),
+        "encode_p95_us": round(percentile(encode_us, 95), 1),
+        "decode_p50_us": round(percentile(decode_us, 50), 1),
+        "decode_p95_us": round(percentile(decode_us, 95), 1),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""对比 split（LLM2 + LLM3）与 fused（单次调用）回合模式的延迟与 token 成本。
+
+输入为 JSONL（可 .gz）：既可以是 GALGAME_TRANSCRIPT_DIR 导出的会话记录，
+也可以是 {"role_desc": "", "world_desc": "", "inputs": ["..."]} 形式的预设。
+每段录制先用 LLM1 生成一次蓝图，再从同一初始状态分别按两种模式回放全部玩家输入。
+回放时不使用选项快速路径，以便只比较两种导演/对话调用方式本身。
+
+    python -m galgame_app.backend.bench_turn_modes recorded.jsonl --limit 20
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import statistics
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+from .llm_client import LLMClient
+from .llm_router import RoutedLLM, build_role_llm, percentile
+from .services.gameplay import GalGameAgent, dynamic_update, fused_turn, generate_blueprint, roleplay_turn
+from .services.state import load_state, state_from_agent
+from .telemetry import cli_logging
+
+
+MODES = ("split", "fused")
+
+
+@dataclass
+class Recording:
+    role_desc: str
+    world_desc: str
+    inputs: List[str] = field(default_factory=list)
+
+
+@dataclass
+class TurnSample:
+    latency_ms: float
+    calls: int
+    input_tokens: int
+    output_tokens: int
+    cost: float
+    ok: bool
+
+
+class MeteredLLM(LLMClient):
+    """汇总路由器逐槽位记录的调用数、token 与成本；降级时按实际服务的模型计价。"""
+
+    def __init__(self, inner: RoutedLLM):
+        self.inner = inner
+        super().__init__(lambda prompt: inner.call_with_usage(prompt)[0])
+
+    def totals(self) -> Tuple[int, int, int, float]:
+        return self.inner.usage()
+
+
+def _open(path: Path) -> Iterator[str]:
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8") as fh:  # type: ignore[operator]
+        yield from fh
+
+
+def _lines(path: Path) -> Iterator[str]:
+    files = sorted(path.glob("*.jsonl*")) if path.is_dir() else [path]
+    for f in files:
+        yield from _open(f)
+
+
+def load_recordings(path: Path) -> List[Recording]:
+    recordings: List[Recording] = []
+    by_session: Dict[str, Recording] = {}
+    for line in _lines(path):
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        kind = row.get("kind")
+        if kind is None:
+            inputs = list(row.get("inputs") or [])
+            recordings.append(Recording(row.get("role_desc", ""), row.get("world_desc", ""), inputs))
+        elif kind == "start":
+            by_session[row["session_id"]] = Recording(row.get("role_desc", ""), row.get("world_desc", ""))
+            recordings.append(by_session[row["session_id"]])
+        elif kind == "turn" and row.get("session_id") in by_session:
+            by_session[row["session_id"]].inputs.append(row.get("user_input", ""))
+    return [r for r in recordings if r.inputs]
+
+
+def _totals(llms: List[MeteredLLM]) -> Tuple[int, int, int, float]:
+    totals = [m.totals() for m in llms]
+    return (
+        sum(t[0] for t in totals),
+        sum(t[1] for t in totals),
+        sum(t[2] for t in totals),
+        sum(t[3] for t in totals),
+    )
+
+
+async def replay(mode: str, base_state: Dict[str, Any], inputs: List[str], llms: List[MeteredLLM]) -> List[TurnSample]:
+    agent = GalGameAgent(*llms)
+    load_state(agent, base_state)
+    samples: List[TurnSample] = []
+    for user_input in inputs:
+        agent.pending_options = {}
+        before = _totals(llms)
+        started = time.perf_counter()
+        ok = True
+        try:
+            if mode == "fused":
+                await fused_turn(agent, agent.affection, agent.current_node_id, user_input)  # type: ignore[arg-type]
+            else:
+                affection, node_id, _, _ = await dynamic_update(
+                    agent, agent.affection, agent.current_node_id, user_input  # type: ignore[arg-type]
+                )
+                await roleplay_turn(agent, affection, node_id, user_input)
+        except (ValueError, RuntimeError):
+            ok = False
+        elapsed = (time.perf_counter() - started) * 1000
+        after = _totals(llms)
+        samples.append(
+            TurnSample(
+                latency_ms=elapsed,
+                calls=after[0] - before[0],
+                input_tokens=after[1] - before[1],
+                output_tokens=after[2] - before[2],
+                cost=after[3] - before[3],
+                ok=ok,
+            )
+        )
+    return samples
+
+
+def summarize(samples: List[TurnSample]) -> Dict[str, Any]:
+    ok = [s for s in samples if s.ok]
+    if not ok:
+        return {"turns": len(samples), "errors": len(samples)}
+    latencies = [s.latency_ms for s in ok]
+    n = len(ok)
+    return {
+        "turns": len(samples),
+        "errors": len(samples) - n,
+        "latency_mean_ms": round(statistics.fmean(latencies), 1),
+        "latency_p50_ms": round(percentile(latencies, 50), 1),
+        "latency_p95_ms": round(percentile(latencies, 95), 1),
+        "calls_per_turn": round(sum(s.calls for s in ok) / n, 2),
+        "input_tokens_per_turn": round(sum(s.input_tokens for s in ok) / n, 1),
+        "output_tokens_per_turn": round(sum(s.output_tokens for s in ok) / n, 1),
+        "cost_per_turn": round(sum(s.cost for s in ok) / n, 6),
+    }
+
+
+async def run(path: Path, limit: int) -> Dict[str, Any]:
+    recordings = load_recordings(path)[: limit or None]
+    llms = [MeteredLLM(build_role_llm(role)) for role in ("llm1", "llm2", "llm3")]
+    samples: Dict[str, List[TurnSample]] = {mode: [] for mode in MODES}
+    for rec in recordings:
+        agent = GalGameAgent(*llms)
+        await generate_blueprint(agent, rec.role_desc, rec.world_desc)
+        base_state = state_from_agent(agent)
+        for mode in MODES:
+            samples[mode].extend(await replay(mode, base_state, rec.inputs, llms))
+    report: Dict[str, Any] = {"recordings": len(recordings), **{mode: summarize(samples[mode]) for mode in MODES}}
+    split, fused = report["split"], report["fused"]
+    if "latency_mean_ms" in split and "latency_mean_ms" in fused:
+        keys = ("latency_mean_ms", "latency_p95_ms", "input_tokens_per_turn", "output_tokens_per_turn", "cost_per_turn")
+        report["fused_vs_split"] = {key: round(fused[key] / split[key], 3) if split[key] else None for key in keys}
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="split / fused 回合模式基准对比")
+    parser.add_argument("recordings", type=Path, help="录制输入 JSONL（支持 .gz）或会话记录目录")
+    parser.add_argument("--limit", type=int, default=0, help="最多回放的录制段数，0 为全部")
+    args = parser.parse_args()
+    with cli_logging():
+        report = asyncio.run(run(args.recordings, args.limit))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Dict, Optional, Tuple
 
 from dotenv import load_dotenv
 
@@ -10,17 +11,99 @@ ENV_PATH = ROOT_DIR / ".env"
 load_dotenv(ENV_PATH)
 
 
+@dataclass
+class RoleModelSettings:
+    model: str
+    temperature: float
+    max_tokens: int
+    # 近期 p95 延迟超过阈值（毫秒）时切到 fallback_model；任一为空/0 则不切换
+    fallback_model: str
+    p95_threshold_ms: float
+
+
+def _role_settings(role: str, default_model: str, default_temperature: float) -> RoleModelSettings:
+    prefix = f"GALGAME_{role.upper()}_"
+    return RoleModelSettings(
+        model=os.getenv(prefix + "MODEL", default_model),
+        temperature=float(os.getenv(prefix + "TEMPERATURE", str(default_temperature))),
+        max_tokens=int(os.getenv(prefix + "MAX_TOKENS", "0")),
+        fallback_model=os.getenv(prefix + "FALLBACK_MODEL", ""),
+        p95_threshold_ms=float(os.getenv(prefix + "P95_THRESHOLD_MS", "0")),
+    )
+
+
+def _model_prices(raw: str) -> Dict[str, Tuple[float, float]]:
+    """解析 "model:输入单价:输出单价,..."（每千 token），用于估算成本。"""
+    prices: Dict[str, Tuple[float, float]] = {}
+    for item in filter(None, (x.strip() for x in raw.split(","))):
+        name, input_price, output_price = item.rsplit(":", 2)
+        prices[name] = (float(input_price), float(output_price))
+    return prices
+
+
+_DEFAULT_MODEL = os.getenv("DASHSCOPE_MODEL", "qwen-plus")
+
+
 @dataclass
 class Settings:
     dashscope_api_key: str = os.getenv("DASHSCOPE_API_KEY", "")
     # 留空使用 dashscope SDK 默认 (https://dashscope.aliyuncs.com/api/v1)。
     # 仅在自定义网关时设置；兼容模式 URL 不适用于 dashscope SDK。
     dashscope_base_url: str = os.getenv("DASHSCOPE_BASE_URL", "")
-    dashscope_model: str = os.getenv("DASHSCOPE_MODEL", "qwen-plus")
+    dashscope_model: str = _DEFAULT_MODEL
+    # LLM1 蓝图 / LLM2 导演数值 / LLM3 角色对话，各自可覆盖模型、温度、max_tokens 与降级模型
+    llm_roles: Dict[str, RoleModelSettings] = field(
+        default_factory=lambda: {
+            "llm1": _role_settings("llm1", _DEFAULT_MODEL, 0.7),
+            "llm2": _role_settings("llm2", _DEFAULT_MODEL, 0.7),
+            "llm3": _role_settings("llm3", _DEFAULT_MODEL, 0.7),
+        }
+    )
+    # split：LLM2 导演 + LLM3 角色两次调用；fused：单次调用同时产出两者
+    turn_mode: str = os.getenv("GALGAME_TURN_MODE", "split")
+    llm_latency_window: int = int(os.getenv("GALGAME_LLM_LATENCY_WINDOW", "50"))
+    # 降级判断只看最近多少秒内的成功调用
+    llm_latency_horizon: float = float(os.getenv("GALGAME_LLM_LATENCY_HORIZON", "300"))
+    llm_model_prices: Dict[str, Tuple[float, float]] = field(
+        default_factory=lambda: _model_prices(os.getenv("GALGAME_LLM_MODEL_PRICES", ""))
+    )
     google_api_key: str = os.getenv("GOOGLE_API_KEY", "")
     google_vertex_base_url: str = os.getenv("GOOGLE_VERTEX_BASE_URL", "")
     image_output_dir: Path = Path(os.getenv("IMAGE_OUTPUT_DIR", ROOT_DIR / "generated"))
+    # 离线预生成的世界目录（catalog.json + worlds/<key>/），/game/start 命中相同预设时直接取用
+    catalog_dir: Path = Path(os.getenv("GALGAME_CATALOG_DIR", ROOT_DIR / "catalog"))
+    # 参考图（立绘）上传字节缓存条数
+    ref_image_cache_size: int = int(os.getenv("GALGAME_REF_IMAGE_CACHE_SIZE", "16"))
+    # 场景描述估计 Jaccard 相似度达到该阈值时复用已渲染的同角色场景图，0 为关闭
+    scene_reuse_threshold: float = float(os.getenv("GALGAME_SCENE_REUSE_THRESHOLD", "0.8"))
+    # memory：会话保存在单个 worker 内存；token：会话状态签名压缩后交给客户端保存，任意 worker 均可处理
+    session_mode: str = os.getenv("GALGAME_SESSION_MODE", "memory")
+    # "kid:secret,kid2:secret2"，第一把用于签发，其余用于轮换期间校验旧令牌
+    session_keys: str = os.getenv("GALGAME_SESSION_KEYS", "")
+    session_token_max_bytes: int = int(os.getenv("GALGAME_SESSION_TOKEN_MAX_BYTES", "32768"))
+    # 生成图片磁盘配额（MB，0 为不限）、会话过期时间（小时，0 为不过期）与后台回收间隔（秒）
+    media_quota_mb: int = int(os.getenv("GALGAME_MEDIA_QUOTA_MB", "0"))
+    session_ttl_hours: float = float(os.getenv("GALGAME_SESSION_TTL_HOURS", "72"))
+    media_gc_interval: float = float(os.getenv("GALGAME_MEDIA_GC_INTERVAL", "600"))
     log_file: Path = Path(os.getenv("GALGAME_LOG_FILE", ROOT_DIR / "session_log.txt"))
+    # 日志轮转：设置 GALGAME_LOG_ROTATE_WHEN（如 midnight / H）时按时间轮转，否则按大小
+    log_max_bytes: int = int(os.getenv("GALGAME_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+    log_backup_count: int = int(os.getenv("GALGAME_LOG_BACKUP_COUNT", "5"))
+    log_rotate_when: str = os.getenv("GALGAME_LOG_ROTATE_WHEN", "")
+    # 按会话采样比例（0-1），WARNING 及以上不受采样影响
+    log_sample_rate: float = float(os.getenv("GALGAME_LOG_SAMPLE_RATE", "1.0"))
+    log_queue_size: int = int(os.getenv("GALGAME_LOG_QUEUE_SIZE", "10000"))
+    # 留空不导出逐会话 gzip 对话记录
+    transcript_dir: Optional[Path] = (
+        Path(os.environ["GALGAME_TRANSCRIPT_DIR"]) if os.getenv("GALGAME_TRANSCRIPT_DIR") else None
+    )
+    # WebSocket 通道：心跳间隔/超时（秒）、单连接发送缓冲事件数、每会话可补发的事件数
+    ws_heartbeat_interval: float = float(os.getenv("GALGAME_WS_HEARTBEAT_INTERVAL", "20"))
+    ws_heartbeat_timeout: float = float(os.getenv("GALGAME_WS_HEARTBEAT_TIMEOUT", "60"))
+    ws_send_buffer: int = int(os.getenv("GALGAME_WS_SEND_BUFFER", "64"))
+    ws_event_log_size: int = int(os.getenv("GALGAME_WS_EVENT_LOG_SIZE", "200"))
+    # 无连接的会话事件日志空闲多少秒后丢弃（断线重连届时改为整体 resync）
+    ws_event_log_idle: float = float(os.getenv("GALGAME_WS_EVENT_LOG_IDLE", "1800"))
 
 
 settings = Settings()
@@ -32,6 +115,9 @@ def _abs_path(path_value: Path) -> Path:
 
 settings.image_output_dir = _abs_path(settings.image_output_dir)
 settings.log_file = _abs_path(settings.log_file)
+settings.catalog_dir = _abs_path(settings.catalog_dir)
+if settings.transcript_dir is not None:
+    settings.transcript_dir = _abs_path(settings.transcript_dir)
 settings.image_output_dir.mkdir(parents=True, exist_ok=True)
 
 # Reuse a top-level generated directory for API static serving
@@ -1,14 +1,18 @@
 import base64
 import io
 import os
+import tempfile
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass
 import json
 from pathlib import Path
-from typing import Any, Callable, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 import dashscope
 from PIL import Image
 from google import genai
+from google.genai import types
 
 from .config import settings
 
@@ -32,15 +36,26 @@ class LLMClient:
 
 
 class OpenAIChatLLM(LLMClient):
-    def __init__(self, model: str = settings.dashscope_model, temperature: float = 0.7, timeout: int = 60):
+    def __init__(
+        self,
+        model: str = settings.dashscope_model,
+        temperature: float = 0.7,
+        timeout: int = 60,
+        max_tokens: int = 0,
+    ):
         self.model = model
         self.temperature = temperature
         self.timeout = timeout
+        self.max_tokens = max_tokens
         super().__init__(self._call)
 
     def _call(self, prompt: str) -> str:
+        return self.call_with_usage(prompt)[0]
+
+    def call_with_usage(self, prompt: str) -> Tuple[str, Dict[str, int]]:
         if not settings.dashscope_api_key:
             raise RuntimeError("DASHSCOPE_API_KEY 未设置，无法调用大模型")
+        extra: Dict[str, Any] = {"max_tokens": self.max_tokens} if self.max_tokens > 0 else {}
         resp = dashscope.Generation.call(
             api_key=settings.dashscope_api_key,
             model=self.model,
@@ -52,31 +67,108 @@ class OpenAIChatLLM(LLMClient):
             result_format="message",
             temperature=self.temperature,
             stream=False,
+            **extra,
         )
         status = getattr(resp, "status_code", 200)
         if status != 200 or not getattr(resp, "output", None):
             code = getattr(resp, "code", "")
             msg = getattr(resp, "message", "dashscope 调用失败")
             raise RuntimeError(f"DashScope error status={status} code={code} msg={msg}")
-        return resp.output.choices[0].message.content
+        usage = getattr(resp, "usage", None)
+        tokens = {
+            "input_tokens": int(getattr(usage, "input_tokens", 0) or 0),
+            "output_tokens": int(getattr(usage, "output_tokens", 0) or 0),
+        }
+        return resp.output.choices[0].message.content, tokens
+
+
+# 同一张立绘会被所有场景图和结局 CG 复用，按 (路径, mtime) 缓存可直接上传的已编码字节与 MIME，
+# 以 bytes Part 传给模型，避免每次调用都由 SDK 把 PIL 图重新编码
+_ref_cache: "OrderedDict[Tuple[str, int], Tuple[bytes, str]]" = OrderedDict()
+_ref_cache_lock = threading.Lock()
+
+
+def _encoded_reference(data: bytes) -> Optional[Tuple[bytes, str]]:
+    suffix = _sniff_image_suffix(data)
+    if suffix is not None:
+        return data, _MIME_TYPES[suffix]
+    # 少见格式（bmp/tiff 等）转一次 PNG
+    try:
+        buf = io.BytesIO()
+        Image.open(io.BytesIO(data)).convert("RGB").save(buf, format="PNG")
+    except Exception:
+        return None
+    return buf.getvalue(), "image/png"
+
+
+def _prepared_reference(path: str) -> Optional[Tuple[bytes, str]]:
+    try:
+        key = (os.path.abspath(path), os.stat(path).st_mtime_ns)
+    except OSError:
+        return None
+    with _ref_cache_lock:
+        cached = _ref_cache.get(key)
+        if cached is not None:
+            _ref_cache.move_to_end(key)
+            return cached
+    try:
+        prepared = _encoded_reference(Path(path).read_bytes())
+    except OSError:
+        return None
+    if prepared is None:
+        return None
+    with _ref_cache_lock:
+        _ref_cache[key] = prepared
+        while len(_ref_cache) > max(settings.ref_image_cache_size, 0):
+            _ref_cache.popitem(last=False)
+    return prepared
 
 
-def _load_image(data: Union[str, bytes]) -> Optional[Image.Image]:
+def _load_reference(data: Union[str, bytes]) -> Optional[types.Part]:
     if isinstance(data, bytes):
+        prepared = _encoded_reference(data)
+    elif os.path.exists(str(data)):
+        prepared = _prepared_reference(str(data))
+    else:
         try:
-            return Image.open(io.BytesIO(data)).convert("RGB")
-        except Exception:
-            return None
-    if os.path.exists(str(data)):
-        try:
-            return Image.open(str(data)).convert("RGB")
-        except Exception:
+            prepared = _encoded_reference(base64.b64decode(data))
+        except ValueError:
             return None
-    try:
-        decoded = base64.b64decode(data)
-        return Image.open(io.BytesIO(decoded)).convert("RGB")
-    except Exception:
+    if prepared is None:
         return None
+    image_bytes, mime_type = prepared
+    return types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
+
+
+_IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+)
+
+
+_MIME_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".gif": "image/gif", ".webp": "image/webp"}
+
+
+def _sniff_image_suffix(data: bytes) -> Optional[str]:
+    for signature, suffix in _IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return suffix
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    # 临时文件名唯一：同一目标的并发写入各写各的，最后一次 os.replace 生效
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=path.name + ".", suffix=".part", delete=False) as fh:
+        fh.write(data)
+    try:
+        os.replace(fh.name, path)
+    except OSError:
+        Path(fh.name).unlink(missing_ok=True)
+        raise
 
 
 def _save_response_images(resp: Any, filename_prefix: str) -> List[str]:
@@ -90,13 +182,19 @@ def _save_response_images(resp: Any, filename_prefix: str) -> List[str]:
         inline_data = getattr(part, "inline_data", None)
         if inline_data is not None:
             try:
-                if hasattr(part, "as_image"):
-                    img = part.as_image()
+                data = inline_data.data
+                if isinstance(data, str):
+                    data = base64.b64decode(data)
+                suffix = _sniff_image_suffix(data)
+                if suffix is not None:
+                    # 直接落盘模型返回的已编码字节，省去解码+重新编码
+                    path = base_dir / f"{stem}_{idx}{suffix}"
+                    _write_atomic(path, data)
                 else:
-                    img = Image.open(io.BytesIO(inline_data.data)).convert("RGB")  # type: ignore[arg-type]
-                fname = f"{stem}_{idx}.png"
-                path = base_dir / fname
-                img.save(path)
+                    path = base_dir / f"{stem}_{idx}.png"
+                    buf = io.BytesIO()
+                    Image.open(io.BytesIO(data)).convert("RGB").save(buf, format="PNG")
+                    _write_atomic(path, buf.getvalue())
                 saved.append(path.as_posix())
                 idx += 1
             except Exception:
@@ -123,10 +221,10 @@ def text2img(prompt: str, seed: Optional[int] = None, filename_prefix: str = "te
 def img2img(init_image: str, prompt: str, seed: Optional[int] = None, filename_prefix: str = "img2img") -> Dict[str, Any]:
     if not _genai_client:
         raise RuntimeError("GOOGLE_API_KEY 未设置，无法调用图像模型")
-    ref_img = _load_image(init_image)
+    ref_part = _load_reference(init_image)
     contents: List[Any] = [prompt]
-    if ref_img is not None:
-        contents.append(ref_img)
+    if ref_part is not None:
+        contents.append(ref_part)
     else:
         contents.append(prompt)
     resp = _genai_client.models.generate_content(model="gemini-2.5-flash-image", contents=contents)
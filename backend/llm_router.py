@@ -0,0 +1,175 @@
+import math
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+from .config import RoleModelSettings, settings
+from .llm_client import LLMClient, OpenAIChatLLM
+
+
+# 进入降级后每隔 N 次仍用主模型探测一次，以便其延迟恢复后切回
+PROBE_EVERY = 10
+# 路由判断只看最近 horizon 秒内的成功调用，且至少 MIN_SAMPLES 个样本（20 个样本时需 2 个慢调用才超 p95），
+# 单次冷启动慢调用不会触发降级，慢样本也会按时间过期而不依赖主模型的探测次数
+MIN_SAMPLES = 20
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[idx]
+
+
+@dataclass
+class ModelStats:
+    model: str
+    window: int
+    # 仅记录成功调用的 (monotonic 时间, 耗时毫秒)；失败调用的耗时（超时、连接错误）不代表模型延迟
+    samples: Deque[Tuple[float, float]] = field(init=False)
+    calls: int = 0
+    errors: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost: float = 0.0
+
+    def __post_init__(self) -> None:
+        self.samples = deque(maxlen=self.window)
+
+    @property
+    def latencies_ms(self) -> List[float]:
+        return [ms for _, ms in self.samples]
+
+    def recent_ms(self, horizon_s: float, now: float) -> List[float]:
+        return [ms for ts, ms in self.samples if now - ts <= horizon_s]
+
+    def record(self, elapsed_ms: float, usage: Optional[Dict[str, int]] = None, error: bool = False) -> None:
+        self.calls += 1
+        if error:
+            self.errors += 1
+            return
+        self.samples.append((time.monotonic(), elapsed_ms))
+        usage = usage or {}
+        self.input_tokens += usage.get("input_tokens", 0)
+        self.output_tokens += usage.get("output_tokens", 0)
+        input_price, output_price = settings.llm_model_prices.get(self.model, (0.0, 0.0))
+        self.cost += (usage.get("input_tokens", 0) * input_price + usage.get("output_tokens", 0) * output_price) / 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "calls": self.calls,
+            "errors": self.errors,
+            "p50_ms": round(percentile(self.latencies_ms, 50), 1),
+            "p95_ms": round(percentile(self.latencies_ms, 95), 1),
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cost": round(self.cost, 6),
+        }
+
+
+class RoutedLLM(LLMClient):
+    """单个角色（llm1/llm2/llm3）的模型路由：主模型近期 p95 超阈值或调用失败时改用降级模型。"""
+
+    def __init__(self, role: str, role_settings: RoleModelSettings, window: int, horizon_s: float = 300.0):
+        self.role = role
+        self.p95_threshold_ms = role_settings.p95_threshold_ms
+        self.horizon_s = horizon_s
+        self.primary = OpenAIChatLLM(
+            model=role_settings.model,
+            temperature=role_settings.temperature,
+            max_tokens=role_settings.max_tokens,
+        )
+        self.fallback: Optional[OpenAIChatLLM] = None
+        if role_settings.fallback_model:
+            self.fallback = OpenAIChatLLM(
+                model=role_settings.fallback_model,
+                temperature=role_settings.temperature,
+                max_tokens=role_settings.max_tokens,
+            )
+        self.stats: Dict[str, ModelStats] = {
+            "primary": ModelStats(role_settings.model, window),
+            "fallback": ModelStats(role_settings.fallback_model, window),
+        }
+        self.fallback_routed = 0
+        self._degraded_calls = 0
+        self._lock = threading.Lock()
+        super().__init__(self._call)
+
+    @property
+    def model(self) -> str:
+        return self.primary.model
+
+    def _choose(self) -> str:
+        with self._lock:
+            primary = self.stats["primary"].recent_ms(self.horizon_s, time.monotonic())
+            slow = (
+                self.fallback is not None
+                and self.p95_threshold_ms > 0
+                and len(primary) >= MIN_SAMPLES
+                and percentile(primary, 95) > self.p95_threshold_ms
+            )
+            if not slow:
+                self._degraded_calls = 0
+                return "primary"
+            self._degraded_calls += 1
+            if self._degraded_calls % PROBE_EVERY == 0:
+                return "primary"
+            self.fallback_routed += 1
+            return "fallback"
+
+    def _invoke(self, slot: str, prompt: str) -> Tuple[str, Dict[str, int]]:
+        client = self.primary if slot == "primary" else self.fallback
+        assert client is not None
+        started = time.perf_counter()
+        try:
+            content, usage = client.call_with_usage(prompt)
+        except Exception:
+            with self._lock:
+                self.stats[slot].record((time.perf_counter() - started) * 1000, error=True)
+            raise
+        with self._lock:
+            self.stats[slot].record((time.perf_counter() - started) * 1000, usage)
+        return content, usage
+
+    def call_with_usage(self, prompt: str) -> Tuple[str, Dict[str, int]]:
+        slot = self._choose()
+        try:
+            return self._invoke(slot, prompt)
+        except Exception:
+            if slot != "primary" or self.fallback is None:
+                raise
+            with self._lock:
+                self.fallback_routed += 1
+            return self._invoke("fallback", prompt)
+
+    def _call(self, prompt: str) -> str:
+        return self.call_with_usage(prompt)[0]
+
+    def usage(self) -> Tuple[int, int, int, float]:
+        """各槽位累计的 (调用数, 输入 token, 输出 token, 成本)；降级调用按降级模型计价。"""
+        with self._lock:
+            slots = list(self.stats.values())
+            return (
+                sum(s.calls for s in slots),
+                sum(s.input_tokens for s in slots),
+                sum(s.output_tokens for s in slots),
+                sum(s.cost for s in slots),
+            )
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "role": self.role,
+                "p95_threshold_ms": self.p95_threshold_ms,
+                "fallback_routed": self.fallback_routed,
+                "primary": self.stats["primary"].to_dict(),
+                "fallback": self.stats["fallback"].to_dict() if self.fallback is not None else None,
+            }
+
+
+def build_role_llm(role: str) -> RoutedLLM:
+    return RoutedLLM(role, settings.llm_roles[role], settings.llm_latency_window, settings.llm_latency_horizon)
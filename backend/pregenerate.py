@@ -0,0 +1,242 @@
+"""离线批量预生成世界：蓝图、立绘与全部节点场景，打包到 GALGAME_CATALOG_DIR 供 /game/start 直接取用。
+
+输入为 JSONL（可 .gz），每行 {"id": "可选", "role_desc": "...", "world_desc": "..."}。
+每个预设的进度写入 worlds/<key>/checkpoint.json，中断后重跑只补齐缺失的步骤；
+运行结束时用全部已完成的检查点重写 catalog.json，服务重启后生效。
+
+    python -m galgame_app.backend.pregenerate presets.jsonl --concurrency 4
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import time
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, TypeVar
+
+from .llm_router import build_role_llm, percentile
+from .services.catalog import WORLD_CATALOG, CatalogWorld, WorldCatalog, preset_key, write_json_atomic
+from .services.gameplay import GalGameAgent, generate_blueprint
+from .services.images import IMAGE_SUFFIXES, render_portrait, render_scene
+from .services.state import load_state, state_from_agent
+from .telemetry import BATCH_LOGGER, cli_logging, log_event
+
+
+T = TypeVar("T")
+
+# 每类调用在报告中保留的错误样例数
+ERROR_SAMPLES = 3
+
+
+@dataclass
+class Preset:
+    preset_id: str
+    role_desc: str
+    world_desc: str
+
+    @property
+    def key(self) -> str:
+        return preset_key(self.role_desc, self.world_desc)
+
+
+def _lines(path: Path) -> Iterator[str]:
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8") as fh:  # type: ignore[operator]
+        yield from fh
+
+
+def load_presets(path: Path) -> List[Preset]:
+    presets: Dict[str, Preset] = {}
+    for lineno, line in enumerate(_lines(path), 1):
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        preset = Preset(str(row.get("id") or lineno), row.get("role_desc", ""), row.get("world_desc", ""))
+        if preset.role_desc.strip():
+            presets.setdefault(preset.key, preset)
+    return list(presets.values())
+
+
+def _complete(checkpoint: Dict[str, Any], directory: Path) -> bool:
+    state = checkpoint.get("state")
+    if not state or not checkpoint.get("portrait"):
+        return False
+    nodes = (state["worldbook"].get("剧本蓝图") or {}).get("node") or []
+    files = [checkpoint["portrait"], *(checkpoint.get("scenes") or {}).values()]
+    return len(files) > len(nodes) and all((directory / name).is_file() for name in files)
+
+
+def _clear_scenes(directory: Path) -> None:
+    # render_scene 命中已有 scene_NNN* 文件时直接返回，不删掉就会把旧外观的场景原样收回
+    for path in directory.glob("scene_*"):
+        if path.suffix.lower() in IMAGE_SUFFIXES:
+            path.unlink(missing_ok=True)
+
+
+class Pipeline:
+    """同时处理的预设数与在途的 LLM/生图调用数都不超过 concurrency。"""
+
+    def __init__(self, catalog: WorldCatalog, concurrency: int):
+        self.catalog = catalog
+        self.llms = [build_role_llm(role) for role in ("llm1", "llm2", "llm3")]
+        self.calls = asyncio.Semaphore(concurrency)
+        self.presets = asyncio.Semaphore(concurrency)
+        self.latencies: Dict[str, Deque[float]] = defaultdict(deque)
+        self.errors: Counter = Counter()
+        self.error_samples: Dict[str, List[str]] = defaultdict(list)
+        self.outcomes: Counter = Counter()
+
+    async def _timed(self, kind: str, make: Callable[[], Awaitable[Optional[T]]]) -> Optional[T]:
+        async with self.calls:
+            started = time.perf_counter()
+            error = "返回空结果"
+            try:
+                result = await make()
+            except Exception as e:  # noqa: BLE001
+                result, error = None, repr(e)
+            self.latencies[kind].append(time.perf_counter() - started)
+        if result is None:
+            self.errors[kind] += 1
+            log_event(BATCH_LOGGER, "pregenerate_call_failed", {"kind": kind, "error": error}, logging.WARNING)
+            if len(self.error_samples[kind]) < ERROR_SAMPLES:
+                self.error_samples[kind].append(error)
+        return result
+
+    async def run_preset(self, preset: Preset) -> None:
+        async with self.presets:
+            self.outcomes[await self._run_preset(preset)] += 1
+
+    async def _run_preset(self, preset: Preset) -> str:
+        directory = self.catalog.world_dir(preset.key)
+        directory.mkdir(parents=True, exist_ok=True)
+        checkpoint_path = directory / "checkpoint.json"
+        checkpoint: Dict[str, Any] = (
+            json.loads(checkpoint_path.read_text(encoding="utf-8")) if checkpoint_path.is_file() else {}
+        )
+        if _complete(checkpoint, directory):
+            return "skipped"
+        checkpoint.update(
+            key=preset.key, preset_id=preset.preset_id, role_desc=preset.role_desc, world_desc=preset.world_desc
+        )
+        checkpoint.setdefault("scenes", {})
+
+        def has_file(name: Optional[str]) -> bool:
+            return bool(name and (directory / name).is_file())
+
+        def save() -> None:
+            write_json_atomic(checkpoint_path, checkpoint)
+
+        agent = GalGameAgent(*self.llms)
+        if checkpoint.get("state"):
+            load_state(agent, checkpoint["state"])
+        else:
+            worldbook = await self._timed(
+                "blueprint", lambda: generate_blueprint(agent, preset.role_desc, preset.world_desc)
+            )
+            if worldbook is None:
+                return "failed"
+            checkpoint["state"] = state_from_agent(agent)
+            save()
+        assert agent.worldbook is not None
+        traits = agent.worldbook.traits
+
+        portrait: Optional[Path]
+        if has_file(checkpoint.get("portrait")):
+            portrait = directory / checkpoint["portrait"]
+        else:
+            target = directory / "portrait.png"
+            portrait = await self._timed("portrait", lambda: asyncio.to_thread(render_portrait, traits, target))
+            if portrait is None:
+                return "failed"
+            # 立绘重新生成后旧场景与角色外观不再一致
+            _clear_scenes(directory)
+            checkpoint["portrait"] = portrait.name
+            checkpoint["scenes"] = {}
+            save()
+
+        async def scene(index: int, node: Any) -> None:
+            target = directory / f"scene_{index:03d}.png"
+            result = await self._timed("scene", lambda: asyncio.to_thread(render_scene, target, portrait, traits, node))
+            if result is not None:
+                checkpoint["scenes"][node.id] = result.name
+                save()
+
+        pending = [
+            scene(i, node)
+            for i, node in enumerate(agent.worldbook.blueprint.sorted_nodes())
+            if not has_file(checkpoint["scenes"].get(node.id))
+        ]
+        await asyncio.gather(*pending)
+        return "completed" if _complete(checkpoint, directory) else "failed"
+
+    def write_catalog(self) -> int:
+        worlds = []
+        for checkpoint in self.catalog.checkpoints():
+            if not _complete(checkpoint, self.catalog.world_dir(checkpoint.get("key", ""))):
+                continue
+            prefix = f"worlds/{checkpoint['key']}/"
+            worlds.append(
+                CatalogWorld(
+                    key=checkpoint["key"],
+                    preset_id=checkpoint["preset_id"],
+                    role_desc=checkpoint["role_desc"],
+                    world_desc=checkpoint["world_desc"],
+                    state=checkpoint["state"],
+                    portrait=prefix + checkpoint["portrait"],
+                    scenes={node_id: prefix + name for node_id, name in checkpoint["scenes"].items()},
+                )
+            )
+        self.catalog.write(worlds)
+        return len(worlds)
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        minutes = elapsed / 60 or 1e-9
+        calls = {
+            kind: {
+                "count": len(values),
+                "errors": self.errors[kind],
+                "error_samples": self.error_samples.get(kind, []),
+                "p50_s": round(percentile(values, 50), 2),
+                "p95_s": round(percentile(values, 95), 2),
+            }
+            for kind, values in sorted(self.latencies.items())
+        }
+        images = sum(len(self.latencies[k]) - self.errors[k] for k in ("portrait", "scene"))
+        return {
+            "presets": sum(self.outcomes.values()),
+            **{outcome: self.outcomes[outcome] for outcome in ("completed", "skipped", "failed")},
+            "elapsed_s": round(elapsed, 1),
+            "worlds_per_min": round(self.outcomes["completed"] / minutes, 2),
+            "images_per_min": round(images / minutes, 2),
+            "calls": calls,
+        }
+
+
+async def run(path: Path, concurrency: int, catalog: WorldCatalog) -> Dict[str, Any]:
+    presets = load_presets(path)
+    pipeline = Pipeline(catalog, concurrency)
+    started = time.perf_counter()
+    await asyncio.gather(*(pipeline.run_preset(p) for p in presets))
+    report = pipeline.report(time.perf_counter() - started)
+    report["catalog_worlds"] = pipeline.write_catalog()
+    report["catalog"] = str(catalog.index_path)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="批量离线预生成世界并打包 catalog")
+    parser.add_argument("presets", type=Path, help="预设 JSONL（支持 .gz）")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时进行的预设数与 LLM/生图调用数上限")
+    parser.add_argument("--catalog-dir", type=Path, help="输出目录，默认 GALGAME_CATALOG_DIR")
+    args = parser.parse_args()
+    catalog = WorldCatalog(args.catalog_dir.resolve()) if args.catalog_dir else WORLD_CATALOG
+    with cli_logging():
+        report = asyncio.run(run(args.presets, max(1, args.concurrency), catalog))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ..config import settings
+from ..services.images import portrait_path, scene_cg_path
+from ..services.media import link_or_copy
+
+
+CATALOG_VERSION = 1
+
+
+def preset_key(role_desc: str, world_desc: str) -> str:
+    """预设键：空白归一化后的角色/世界描述的 sha1，/game/start 以此 O(1) 命中预生成世界。"""
+    normalized = " ".join(role_desc.split()) + "\x1f" + " ".join(world_desc.split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CatalogWorld:
+    key: str
+    preset_id: str
+    role_desc: str
+    world_desc: str
+    state: Dict[str, Any]
+    # 相对 catalog 目录的图片路径
+    portrait: str = ""
+    scenes: Dict[str, str] = field(default_factory=dict)
+
+
+def write_json_atomic(path: Path, data: Any) -> None:
+    tmp = path.with_name(path.name + ".part")
+    tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+class WorldCatalog:
+    """预生成世界目录：<root>/catalog.json 为索引，<root>/worlds/<key>/ 存放检查点与图片。
+
+    图片不放在 MediaStore 中，避免被会话过期/配额回收；开局时硬链接进新会话目录。
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.worlds: Dict[str, CatalogWorld] = {}
+
+    @property
+    def index_path(self) -> Path:
+        return self.root / "catalog.json"
+
+    def world_dir(self, key: str) -> Path:
+        return self.root / "worlds" / key
+
+    def load(self) -> int:
+        if not self.index_path.is_file():
+            self.worlds = {}
+            return 0
+        data = json.loads(self.index_path.read_text(encoding="utf-8"))
+        if data.get("version") != CATALOG_VERSION:
+            raise ValueError(f"不支持的 catalog 版本: {data.get('version')}")
+        self.worlds = {key: CatalogWorld(**row) for key, row in (data.get("worlds") or {}).items()}
+        return len(self.worlds)
+
+    def write(self, worlds: Iterable[CatalogWorld]) -> None:
+        self.worlds = {w.key: w for w in worlds}
+        self.root.mkdir(parents=True, exist_ok=True)
+        write_json_atomic(
+            self.index_path,
+            {"version": CATALOG_VERSION, "worlds": {key: asdict(w) for key, w in sorted(self.worlds.items())}},
+        )
+
+    def lookup(self, role_desc: str, world_desc: str) -> Optional[CatalogWorld]:
+        if not self.worlds:
+            return None
+        return self.worlds.get(preset_key(role_desc, world_desc))
+
+    def materialize(self, world: CatalogWorld, session_id: str) -> Tuple[Optional[Path], Dict[str, Path]]:
+        """把预生成的立绘与全部节点场景链接进会话目录，返回 (立绘路径, {node_id: 场景路径})。"""
+        portrait: Optional[Path] = None
+        source = self.root / world.portrait
+        if world.portrait and source.is_file():
+            portrait = link_or_copy(source, portrait_path(session_id).with_suffix(source.suffix))
+        scenes: Dict[str, Path] = {}
+        for node_id, rel in world.scenes.items():
+            source = self.root / rel
+            if source.is_file():
+                scenes[node_id] = link_or_copy(source, scene_cg_path(session_id, node_id).with_suffix(source.suffix))
+        return portrait, scenes
+
+    def checkpoints(self) -> List[Dict[str, Any]]:
+        directory = self.root / "worlds"
+        rows: List[Dict[str, Any]] = []
+        for path in sorted(directory.glob("*/checkpoint.json")) if directory.is_dir() else []:
+            try:
+                rows.append(json.loads(path.read_text(encoding="utf-8")))
+            except ValueError:
+                continue
+        return rows
+
+
+WORLD_CATALOG = WorldCatalog(settings.catalog_dir)
@@ -1,10 +1,13 @@
 import asyncio
 import json
+import time
+from collections import Counter
 from typing import Any, Dict, Optional, Tuple
 
 from ..llm_client import LLMClient
 from ..models import Blueprint, CharacterTraits, Node, Worldbook, clamp_affection, parse_worldbook
-from ..prompts import build_llm1_prompt, build_llm2_prompt, build_llm3_prompt
+from ..prompts import build_fused_turn_prompt, build_llm1_prompt, build_llm2_prompt, build_llm3_prompt
+from ..telemetry import record_provider
 
 
 class GalGameAgent:
@@ -15,6 +18,10 @@ class GalGameAgent:
         self.worldbook: Optional[Worldbook] = None
         self.affection: int = 0
         self.current_node_id: Optional[str] = None
+        # 上一轮 LLM3 给出的选项文本 -> 预判效果 {"affection_delta", "stage_effect"}
+        self.pending_options: Dict[str, Dict[str, Any]] = {}
+        # 本轮好感度/节点的来源："director"（LLM2）或 "option"（选项快速路径）
+        self.last_update_source: str = ""
 
     def _select_node_for_affection(self, affection: int) -> str:
         assert self.worldbook is not None, "Worldbook not initialized"
@@ -26,17 +33,64 @@ class GalGameAgent:
         return candidate
 
 
-async def _call_llm(llm: LLMClient, prompt: str) -> str:
-    return await asyncio.to_thread(llm, prompt)
+MAX_AFFECTION_STEP = 15
 
+# 导演路径计数：option 为命中预判选项跳过 LLM2 的次数，director 为调用 LLM2 的次数，fused 为合并回合调用次数
+UPDATE_COUNTERS: Counter = Counter()
 
-async def generate_blueprint(agent: GalGameAgent, role_desc: str, world_desc: str) -> Worldbook:
-    prompt = build_llm1_prompt(role_desc, world_desc)
-    raw = await _call_llm(agent.llm1, prompt)
+
+def _option_effect(raw: Any) -> Optional[Dict[str, Any]]:
+    if not isinstance(raw, dict):
+        return None
+    try:
+        delta = int(raw.get("affection_delta"))
+    except (TypeError, ValueError):
+        return None
+    delta = max(-MAX_AFFECTION_STEP, min(MAX_AFFECTION_STEP, delta))
+    return {"affection_delta": delta, "stage_effect": str(raw.get("stage_effect", ""))}
+
+
+def option_fast_path(
+    agent: GalGameAgent,
+    affection: int,
+    user_input: str,
+) -> Optional[Tuple[int, str, str, Dict[str, Any]]]:
+    effect = agent.pending_options.get(user_input.strip())
+    if effect is None:
+        return None
+    affection = clamp_affection(affection + effect["affection_delta"])
+    current_node_id = agent._select_node_for_affection(affection)
+    agent.affection = affection
+    agent.current_node_id = current_node_id
+    logic_reason = f"选项预判：好感度 {effect['affection_delta']:+d}。{effect['stage_effect']}".strip()
+    return affection, current_node_id, logic_reason, {}
+
+
+async def _call_llm(llm: LLMClient, prompt: str, role: str = "llm") -> str:
+    started = time.perf_counter()
+    try:
+        raw = await asyncio.to_thread(llm, prompt)
+    except Exception as e:
+        record_provider(role, time.perf_counter() - started, prompt_chars=len(prompt), error=e)
+        raise
+    record_provider(role, time.perf_counter() - started, prompt_chars=len(prompt), output_chars=len(raw or ""))
+    return raw
+
+
+def _parse_json_object(raw: str, what: str) -> Dict[str, Any]:
     try:
         data = json.loads(raw)
     except json.JSONDecodeError as e:
-        raise ValueError(f"蓝图生成 LLM 输出非 JSON: {e} | output={raw}") from e
+        raise ValueError(f"{what} LLM 输出非 JSON: {e} | output={raw}") from e
+    if not isinstance(data, dict):
+        raise ValueError(f"{what} LLM 输出不是 JSON 对象 | output={raw}")
+    return data
+
+
+async def generate_blueprint(agent: GalGameAgent, role_desc: str, world_desc: str) -> Worldbook:
+    prompt = build_llm1_prompt(role_desc, world_desc)
+    raw = await _call_llm(agent.llm1, prompt, role="llm1")
+    data = _parse_json_object(raw, "蓝图生成")
     worldbook = parse_worldbook(data)
     if not worldbook.blueprint.nodes:
         raise ValueError(f"蓝图生成为空，请检查 LLM 输出: {raw}")
@@ -53,24 +107,46 @@ async def dynamic_update(
     user_input: str,
 ) -> Tuple[int, str, str, Dict[str, Any]]:
     assert agent.worldbook is not None, "Worldbook not initialized"
+    fast = option_fast_path(agent, affection, user_input)
+    if fast is not None:
+        UPDATE_COUNTERS["option"] += 1
+        agent.last_update_source = "option"
+        return fast
+    UPDATE_COUNTERS["director"] += 1
+    agent.last_update_source = "director"
     current_node = agent.worldbook.blueprint.nodes[current_node_id]
     prompt2 = build_llm2_prompt(user_input, affection, current_node, agent.worldbook.blueprint)
-    raw2 = await _call_llm(agent.llm2, prompt2)
-    try:
-        llm2_out = json.loads(raw2)
-    except json.JSONDecodeError as e:
-        raise ValueError(f"导演数值 LLM 输出非 JSON: {e} | output={raw2}") from e
+    raw2 = await _call_llm(agent.llm2, prompt2, role="llm2")
+    llm2_out = _parse_json_object(raw2, "导演数值")
+    return _apply_director_output(agent, llm2_out, affection, current_node_id)
+
 
-    affection = clamp_affection(int(llm2_out.get("affection", affection)))
+def _apply_director_output(
+    agent: GalGameAgent,
+    llm2_out: Dict[str, Any],
+    affection: int,
+    current_node_id: str,
+) -> Tuple[int, str, str, Dict[str, Any]]:
+    assert agent.worldbook is not None, "Worldbook not initialized"
+    try:
+        affection = clamp_affection(int(llm2_out.get("affection", affection)))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"导演输出的 affection 不是整数: {llm2_out.get('affection')!r}") from e
 
     node_ext: Dict[str, Any] = llm2_out.get("node_extension", {}) if llm2_out.get("is_custom_node") else {}
     if llm2_out.get("is_custom_node"):
+        if not isinstance(node_ext, dict) or not node_ext.get("id"):
+            raise ValueError(f"自定义节点缺少 node_extension.id: {node_ext!r}")
+        try:
+            threshold = int(node_ext.get("affection_threshold", affection))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"自定义节点的 affection_threshold 不是整数: {node_ext!r}") from e
         new_node = Node(
-            id=str(node_ext.get("id")),
+            id=str(node_ext["id"]),
             label=node_ext.get("label", ""),
             details=node_ext.get("details", ""),
             scene=node_ext.get("scene", ""),
-            affection_threshold=int(node_ext.get("affection_threshold", affection)),
+            affection_threshold=threshold,
         )
         agent.worldbook.blueprint.nodes[new_node.id] = new_node
         current_node_id = new_node.id
@@ -78,6 +154,7 @@ async def dynamic_update(
         current_node_id = str(llm2_out.get("current_node_id", current_node_id))
 
     current_node_id = agent._select_node_for_affection(affection)
+    agent.affection = affection
     agent.current_node_id = current_node_id
     logic_reason = llm2_out.get("logic_reason", "")
     return affection, current_node_id, logic_reason, node_ext
@@ -92,11 +169,18 @@ async def roleplay_turn(
     assert agent.worldbook is not None, "Worldbook not initialized"
     current_node = agent.worldbook.blueprint.nodes[current_node_id]
     prompt3 = build_llm3_prompt(user_input, agent.worldbook, current_node, affection)
-    raw3 = await _call_llm(agent.llm3, prompt3)
-    try:
-        llm3_out = json.loads(raw3)
-    except json.JSONDecodeError as e:
-        raise ValueError(f"角色对话 LLM 输出非 JSON: {e} | output={raw3}") from e
+    raw3 = await _call_llm(agent.llm3, prompt3, role="llm3")
+    llm3_out = _parse_json_object(raw3, "角色对话")
+    return _apply_roleplay_output(agent, llm3_out)
+
+
+def _apply_roleplay_output(agent: GalGameAgent, llm3_out: Dict[str, Any]) -> Dict[str, Any]:
+    agent.pending_options = {}
+    for key in ("option_a", "option_b"):
+        text = str(llm3_out.get(key, "")).strip()
+        effect = _option_effect(llm3_out.get(f"{key}_effect"))
+        if text and effect is not None:
+            agent.pending_options[text] = effect
     return {
         "dialogue": llm3_out.get("对话回应", ""),
         "expression": llm3_out.get("表情", ""),
@@ -104,3 +188,26 @@ async def roleplay_turn(
         "option_a": llm3_out.get("option_a", ""),
         "option_b": llm3_out.get("option_b", ""),
     }
+
+
+async def fused_turn(
+    agent: GalGameAgent,
+    affection: int,
+    current_node_id: str,
+    user_input: str,
+) -> Tuple[Tuple[int, str, str, Dict[str, Any]], Dict[str, Any]]:
+    """单次调用同时产出导演数值与角色对话；命中预判选项时仍走快速路径，只调用一次 LLM3。"""
+    assert agent.worldbook is not None, "Worldbook not initialized"
+    fast = option_fast_path(agent, affection, user_input)
+    if fast is not None:
+        UPDATE_COUNTERS["option"] += 1
+        agent.last_update_source = "option"
+        return fast, await roleplay_turn(agent, fast[0], fast[1], user_input)
+    UPDATE_COUNTERS["fused"] += 1
+    agent.last_update_source = "fused"
+    current_node = agent.worldbook.blueprint.nodes[current_node_id]
+    prompt = build_fused_turn_prompt(user_input, agent.worldbook, current_node, affection)
+    raw = await _call_llm(agent.llm3, prompt, role="fused")
+    out = _parse_json_object(raw, "合并回合")
+    director = _apply_director_output(agent, out, affection, current_node_id)
+    return director, _apply_roleplay_output(agent, out)
@@ -1,17 +1,23 @@
+import time
 from pathlib import Path
 from typing import Any, Dict, Optional
 
-from ..config import GENERATED_DIR
 from ..llm_client import img2img, text2img
 from ..models import CharacterTraits, Node
 from ..prompts import build_final_cg_prompt, build_fused_scene_prompt, build_portrait_prompt, stage_hint
+from ..services.media import MEDIA_STORE, link_or_copy
+from ..services.similarity import SCENE_INDEX, scene_namespace
+from ..telemetry import MEDIA_LOGGER, log_event, record_provider
+
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp", ".gif"}
 
 
 def _find_existing_image(base: Path) -> Optional[Path]:
     if base.exists():
         return base
     stem = base.with_suffix("").name
-    candidates = sorted(base.parent.glob(f"{stem}*.png"))
+    candidates = sorted(p for p in base.parent.glob(f"{stem}*") if p.suffix.lower() in IMAGE_SUFFIXES)
     return candidates[0] if candidates else None
 
 
@@ -19,28 +25,30 @@ def _safe_text2img(prompt: str, output: Path) -> Optional[Path]:
     existing = _find_existing_image(output)
     if existing:
         return existing
+    started = time.perf_counter()
     try:
         res = text2img(prompt, filename_prefix=output.with_suffix("").as_posix())
-        paths = res.get("saved_paths") or []
-        if paths:
-            return Path(paths[0])
-    except Exception:
+    except Exception as e:
+        record_provider("text2img", time.perf_counter() - started, prompt_chars=len(prompt), error=e)
         return None
-    return None
+    paths = res.get("saved_paths") or []
+    record_provider("text2img", time.perf_counter() - started, prompt_chars=len(prompt))
+    return Path(paths[0]) if paths else None
 
 
 def _safe_img2img(prompt: str, init_image: Path, output: Path) -> Optional[Path]:
     existing = _find_existing_image(output)
     if existing:
         return existing
+    started = time.perf_counter()
     try:
         res = img2img(init_image.as_posix(), prompt, filename_prefix=output.with_suffix("").as_posix())
-        paths = res.get("saved_paths") or []
-        if paths:
-            return Path(paths[0])
-    except Exception:
+    except Exception as e:
+        record_provider("img2img", time.perf_counter() - started, prompt_chars=len(prompt), error=e)
         return None
-    return None
+    paths = res.get("saved_paths") or []
+    record_provider("img2img", time.perf_counter() - started, prompt_chars=len(prompt))
+    return Path(paths[0]) if paths else None
 
 
 def _safe_name(value: str) -> str:
@@ -48,21 +56,34 @@ def _safe_name(value: str) -> str:
 
 
 def portrait_path(session_id: str) -> Path:
-    return GENERATED_DIR / f"portrait_{session_id}.png"
+    return MEDIA_STORE.path_for(session_id, f"portrait_{session_id}.png")
 
 
 def scene_cg_path(session_id: str, node_id: str) -> Path:
     safe_node = _safe_name(node_id)
-    return GENERATED_DIR / f"scene_{session_id}_node_{safe_node}.png"
+    return MEDIA_STORE.path_for(session_id, f"scene_{session_id}_node_{safe_node}.png")
 
 
 def final_cg_path(session_id: str) -> Path:
-    return GENERATED_DIR / f"final_cg_{session_id}.png"
+    return MEDIA_STORE.path_for(session_id, f"final_cg_{session_id}.png")
 
 
-def generate_portrait(traits: CharacterTraits, session_id: str) -> Optional[Path]:
+def render_portrait(traits: CharacterTraits, target: Path) -> Optional[Path]:
     prompt = build_portrait_prompt(traits)["cn"]
-    return _safe_text2img(prompt, portrait_path(session_id))
+    return _safe_text2img(prompt, target)
+
+
+def render_scene(target: Path, portrait: Optional[Path], traits: CharacterTraits, node: Node) -> Optional[Path]:
+    prompt = build_fused_scene_prompt(traits, node.scene, stage_hint(node.affection_threshold), node.details)["cn"]
+    if portrait and portrait.exists():
+        maybe = _safe_img2img(prompt, portrait, target)
+        if maybe:
+            return maybe
+    return _safe_text2img(prompt, target)
+
+
+def generate_portrait(traits: CharacterTraits, session_id: str) -> Optional[Path]:
+    return render_portrait(traits, portrait_path(session_id))
 
 
 def generate_scene_image(
@@ -72,12 +93,20 @@ def generate_scene_image(
     node: Node,
 ) -> Optional[Path]:
     target = scene_cg_path(session_id, node.id)
-    prompt = build_fused_scene_prompt(traits, node.scene, stage_hint(node.affection_threshold), node.details)["cn"]
-    if portrait and portrait.exists():
-        maybe = _safe_img2img(prompt, portrait, target)
-        if maybe:
-            return maybe
-    return _safe_text2img(prompt, target)
+    existing = _find_existing_image(target)
+    if existing:
+        return existing
+    namespace = scene_namespace(portrait, traits.appearance, stage_hint(node.affection_threshold), node.scene)
+    similar = SCENE_INDEX.lookup(namespace, node.scene)
+    if similar is not None:
+        source, score = similar
+        log_event(MEDIA_LOGGER, "scene_reuse", {"node_id": node.id, "source": source.name, "score": round(score, 3)})
+        # 硬链接到本会话目录：URL 仍归属本会话，原会话被回收也不影响
+        return link_or_copy(source, target.with_name(f"{target.stem}_reuse{source.suffix}"))
+    result = render_scene(target, portrait, traits, node)
+    if result is not None:
+        SCENE_INDEX.add(namespace, node.scene, result)
+    return result
 
 
 def generate_final_cg(session_id: str, traits: CharacterTraits, node: Node, portrait: Optional[Path]) -> Optional[Path]:
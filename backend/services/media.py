@@ -0,0 +1,268 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from ..config import GENERATED_DIR, settings
+from ..telemetry import MEDIA_LOGGER, cli_logging, log_event
+
+
+SESSION_ID_RE = re.compile(r"[0-9a-f]{32}")
+_STRAY_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp", ".gif", ".tmp", ".part"}
+_TEMP_SUFFIXES = {".tmp", ".part"}
+# 临时文件超过该时长未改动才视为残留，避免删掉正在写入的图片
+STALE_TEMP_SECONDS = 3600
+MEDIA_NAME_RE = re.compile(r"^(?:portrait|scene|final_cg)_([0-9a-f]{32})(?:_[\w-]*)?\.(?:png|jpe?g|webp|gif)$")
+
+
+@dataclass
+class SessionUsage:
+    session_id: str
+    path: Path
+    bytes: int
+    last_played: float
+
+
+@dataclass
+class MediaReport:
+    evicted_sessions: List[str] = field(default_factory=list)
+    freed_bytes: int = 0
+    migrated_files: int = 0
+    removed_files: int = 0
+    removed_dirs: int = 0
+    usage_bytes: int = 0
+
+    def to_dict(self) -> Dict[str, object]:
+        return asdict(self)
+
+
+class MediaStore:
+    """生成图片按 session_id 哈希分片存放：<root>/<sha1[:2]>/<session_id>/<文件名>。
+
+    文件名保持 portrait_<sid>_0.png 等旧格式，/media/<文件名> 的 URL 不变；
+    会话目录的 mtime 视为最近游玩时间，用于过期与 LRU 淘汰。
+    """
+
+    def __init__(self, root: Path, quota_bytes: int = 0, ttl_seconds: float = 0):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def shard(session_id: str) -> str:
+        return hashlib.sha1(session_id.encode("utf-8")).hexdigest()[:2]
+
+    def session_dir(self, session_id: str) -> Path:
+        return self.root / self.shard(session_id) / session_id
+
+    def path_for(self, session_id: str, filename: str) -> Path:
+        directory = self.session_dir(session_id)
+        directory.mkdir(parents=True, exist_ok=True)
+        return directory / filename
+
+    def resolve(self, filename: str) -> Optional[Path]:
+        match = MEDIA_NAME_RE.match(filename)
+        if not match:
+            return None
+        sharded = self.session_dir(match.group(1)) / filename
+        if sharded.is_file():
+            return sharded
+        legacy = self.root / filename
+        return legacy if legacy.is_file() else None
+
+    def touch(self, session_id: str) -> None:
+        directory = self.session_dir(session_id)
+        if directory.is_dir():
+            os.utime(directory)
+
+    def sessions(self) -> List[SessionUsage]:
+        usages: List[SessionUsage] = []
+        for shard_dir in self.root.iterdir() if self.root.is_dir() else ():
+            if not shard_dir.is_dir() or len(shard_dir.name) != 2:
+                continue
+            for session_dir in shard_dir.iterdir():
+                if not session_dir.is_dir() or not SESSION_ID_RE.fullmatch(session_dir.name):
+                    continue
+                size = sum(f.stat().st_size for f in session_dir.iterdir() if f.is_file())
+                usages.append(SessionUsage(session_dir.name, session_dir, size, session_dir.stat().st_mtime))
+        return usages
+
+    def evict(self, session_id: str) -> int:
+        directory = self.session_dir(session_id)
+        if not directory.is_dir():
+            return 0
+        freed = sum(f.stat().st_size for f in directory.iterdir() if f.is_file())
+        shutil.rmtree(directory, ignore_errors=True)
+        try:
+            directory.parent.rmdir()
+        except OSError:
+            pass
+        return freed
+
+    def collect(
+        self, protect: Iterable[str] = (), now: Optional[float] = None, enforce_quota: bool = True
+    ) -> MediaReport:
+        """删除过期会话的图片，再按最近游玩时间从旧到新淘汰直到低于配额；protect 中的会话不会被淘汰。
+
+        enforce_quota=False 时只按过期时间回收，供不知道哪些会话仍在游玩的离线命令使用。
+        """
+        now = time.time() if now is None else now
+        protected: Set[str] = set(protect)
+        report = MediaReport()
+        usages = sorted(self.sessions(), key=lambda u: u.last_played)
+        total = sum(u.bytes for u in usages)
+        for usage in usages:
+            if usage.session_id in protected:
+                continue
+            expired = self.ttl_seconds > 0 and now - usage.last_played > self.ttl_seconds
+            over_quota = enforce_quota and self.quota_bytes > 0 and total > self.quota_bytes
+            if not (expired or over_quota):
+                continue
+            freed = self.evict(usage.session_id)
+            total -= freed
+            report.freed_bytes += freed
+            report.evicted_sessions.append(usage.session_id)
+        report.usage_bytes = total
+        return report
+
+    def reconcile(
+        self, live: Optional[Iterable[str]] = None, dry_run: bool = False, enforce_quota: bool = True
+    ) -> MediaReport:
+        """迁移旧版平铺文件到分片目录，清理残留的图片/临时文件、空目录，以及（给定 live 时）不属于存活会话的目录。
+
+        给定 live 时其中的会话也不会被过期/配额回收。
+        """
+        report = MediaReport()
+        now = time.time()
+        live_set = set(live) if live is not None else None
+        for entry in list(self.root.iterdir()) if self.root.is_dir() else []:
+            if entry.is_file():
+                match = MEDIA_NAME_RE.match(entry.name)
+                if match is not None:
+                    report.migrated_files += 1
+                    if not dry_run:
+                        entry.replace(self.path_for(match.group(1), entry.name))
+                elif entry.suffix.lower() in _STRAY_SUFFIXES and not _in_progress(entry, now):
+                    report.removed_files += 1
+                    if not dry_run:
+                        _remove(entry)
+                continue
+            if not entry.is_dir() or len(entry.name) != 2:
+                continue
+            for session_dir in list(entry.iterdir()):
+                orphan = (
+                    not session_dir.is_dir()
+                    or not SESSION_ID_RE.fullmatch(session_dir.name)
+                    or self.shard(session_dir.name) != entry.name
+                    or (live_set is not None and session_dir.name not in live_set)
+                )
+                if orphan:
+                    report.removed_dirs += 1
+                    if not dry_run:
+                        _remove(session_dir)
+                    continue
+                for f in list(session_dir.iterdir()):
+                    match = MEDIA_NAME_RE.match(f.name)
+                    if (match is None or match.group(1) != session_dir.name) and not _in_progress(f, now):
+                        report.removed_files += 1
+                        if not dry_run:
+                            _remove(f)
+                if not dry_run and not any(session_dir.iterdir()):
+                    session_dir.rmdir()
+                    report.removed_dirs += 1
+            if not dry_run and not any(entry.iterdir()):
+                entry.rmdir()
+        if not dry_run:
+            expired = self.collect(protect=live_set or (), enforce_quota=enforce_quota)
+            report.evicted_sessions = expired.evicted_sessions
+            report.freed_bytes = expired.freed_bytes
+        report.usage_bytes = sum(u.bytes for u in self.sessions())
+        return report
+
+
+def link_or_copy(source: Path, target: Path) -> Path:
+    """硬链接到目标路径（同一文件系统时不占额外空间），失败时退回复制。"""
+    if target.exists() and target.resolve() == source.resolve():
+        return target
+    target.unlink(missing_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+    return target
+
+
+def _in_progress(path: Path, now: float) -> bool:
+    if path.suffix.lower() not in _TEMP_SUFFIXES:
+        return False
+    try:
+        return now - path.stat().st_mtime < STALE_TEMP_SECONDS
+    except OSError:
+        return False
+
+
+def _remove(path: Path) -> None:
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+MEDIA_STORE = MediaStore(
+    GENERATED_DIR,
+    quota_bytes=settings.media_quota_mb * 1024 * 1024,
+    ttl_seconds=settings.session_ttl_hours * 3600,
+)
+
+
+def _read_live(source: str) -> Set[str]:
+    text = sys.stdin.read() if source == "-" else Path(source).read_text(encoding="utf-8")
+    return {line.strip() for line in text.splitlines() if SESSION_ID_RE.fullmatch(line.strip())}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="生成图片目录维护")
+    parser.add_argument("command", choices=["reconcile", "gc", "usage"])
+    parser.add_argument("--dry-run", action="store_true", help="reconcile 时只统计不删除")
+    parser.add_argument(
+        "--live-from",
+        help="存活会话 ID 列表文件（每行一个，- 为标准输入）；reconcile 会删除不在列表中的会话目录，列表中的会话不会被回收",
+    )
+    parser.add_argument(
+        "--quota",
+        action="store_true",
+        help="同时按配额淘汰；默认只按过期时间回收，以免与运行中的服务并行时淘汰正在游玩的会话",
+    )
+    args = parser.parse_args(argv)
+    with cli_logging():
+        output = _run(args)
+        if args.command != "usage":
+            log_event(MEDIA_LOGGER, f"media_{args.command}", output)
+    print(json.dumps(output, ensure_ascii=False, indent=2))
+
+
+def _run(args: argparse.Namespace) -> Dict[str, object]:
+    live = _read_live(args.live_from) if args.live_from else None
+    if args.command == "reconcile":
+        report = MEDIA_STORE.reconcile(live=live, dry_run=args.dry_run, enforce_quota=args.quota)
+    elif args.command == "gc":
+        report = MEDIA_STORE.collect(protect=live or (), enforce_quota=args.quota)
+    else:
+        report = MediaReport(usage_bytes=sum(u.bytes for u in MEDIA_STORE.sessions()))
+    output = report.to_dict()
+    if args.command != "usage" and not args.dry_run:
+        # similarity 依赖本模块，放在这里导入避免循环引用
+        from .similarity import SCENE_INDEX
+
+        output["scene_index_pruned"] = SCENE_INDEX.compact()
+    return output
+
+if __name__ == "__main__":
+    main()
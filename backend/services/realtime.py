@@ -0,0 +1,228 @@
+import asyncio
+import re
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+
+# 1013 = Try Again Later：发送缓冲溢出时让客户端稍后带 last_seq 重连补发
+CLOSE_SLOW_CONSUMER = 1013
+CLOSE_HEARTBEAT_TIMEOUT = 4408
+
+_SENTENCE_END = re.compile(r"(?<=[。！？!?…~\n])")
+
+
+def split_dialogue(text: str, max_chars: int = 40) -> List[str]:
+    chunks: List[str] = []
+    for sentence in _SENTENCE_END.split(text or ""):
+        while len(sentence) > max_chars:
+            chunks.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if sentence:
+            chunks.append(sentence)
+    return chunks
+
+
+class EventLog:
+    def __init__(self, maxlen: int):
+        self.seq = 0
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=maxlen)
+        self.last_active = time.monotonic()
+
+    def append(self, event_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        self.last_active = time.monotonic()
+        self.seq += 1
+        event = {"seq": self.seq, "type": event_type, "data": data}
+        self.events.append(event)
+        return event
+
+    def since(self, seq: int) -> List[Dict[str, Any]]:
+        return [e for e in self.events if e["seq"] > seq]
+
+    def has_gap(self, seq: int) -> bool:
+        """客户端的 last_seq 之后有事件已被挤出缓冲，或来自另一份日志（服务重启/换 worker）。"""
+        if seq <= 0:
+            return False
+        if seq > self.seq:
+            return True
+        return bool(self.events) and self.events[0]["seq"] > seq + 1
+
+
+class EventHub:
+    def __init__(self, log_size: int):
+        self.log_size = log_size
+        self.logs: Dict[str, EventLog] = {}
+        self.connections: Dict[str, Set["GameConnection"]] = {}
+
+    def log(self, session_id: str) -> EventLog:
+        if session_id not in self.logs:
+            self.logs[session_id] = EventLog(self.log_size)
+        return self.logs[session_id]
+
+    def publish(self, session_id: str, event_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        event = self.log(session_id).append(event_type, data)
+        for conn in list(self.connections.get(session_id, ())):
+            conn.push(event)
+        return event
+
+    def attach(self, conn: "GameConnection") -> None:
+        self.connections.setdefault(conn.session_id, set()).add(conn)
+
+    def detach(self, conn: "GameConnection") -> None:
+        conns = self.connections.get(conn.session_id)
+        if conns is not None:
+            conns.discard(conn)
+            if not conns:
+                self.connections.pop(conn.session_id, None)
+
+    def drop(self, session_id: str) -> None:
+        self.logs.pop(session_id, None)
+        self.connections.pop(session_id, None)
+
+    def expire(self, idle_seconds: float, now: Optional[float] = None) -> int:
+        """丢弃无连接且超过 idle_seconds 没有新事件的日志；token 模式的会话不在 SESSIONS 中，只能靠这里回收。"""
+        now = time.monotonic() if now is None else now
+        idle = [
+            sid
+            for sid, log in self.logs.items()
+            if sid not in self.connections and now - log.last_active > idle_seconds
+        ]
+        for sid in idle:
+            self.logs.pop(sid, None)
+        return len(idle)
+
+
+class GameConnection:
+    def __init__(
+        self,
+        websocket: WebSocket,
+        session_id: str,
+        hub: EventHub,
+        send_buffer: int,
+        heartbeat_interval: float,
+        heartbeat_timeout: float,
+    ):
+        self.websocket = websocket
+        self.session_id = session_id
+        self.hub = hub
+        self.queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=send_buffer)
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.last_seen = time.monotonic()
+        self.close_code = 1000
+        self.close_reason = ""
+        # 已发出的最大 seq：补发与实时推送可能重叠，按 seq 去重
+        self.sent_seq = 0
+        self._closed = asyncio.Event()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed.is_set()
+
+    def close(self, code: int = 1000, reason: str = "") -> None:
+        if not self.closed:
+            self.close_code = code
+            self.close_reason = reason
+            self._closed.set()
+
+    def push(self, event: Dict[str, Any]) -> bool:
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.close(CLOSE_SLOW_CONSUMER, "send buffer full")
+            return False
+        return True
+
+    async def _send(self, event: Dict[str, Any]) -> None:
+        seq = event.get("seq")
+        if seq is not None:
+            if seq <= self.sent_seq:
+                return
+            self.sent_seq = seq
+        await self.websocket.send_json(event)
+
+    async def _writer(self) -> None:
+        while True:
+            await self._send(await self.queue.get())
+
+    async def _heartbeat(self) -> None:
+        while not self.closed:
+            await asyncio.sleep(self.heartbeat_interval)
+            if time.monotonic() - self.last_seen > self.heartbeat_timeout:
+                self.close(CLOSE_HEARTBEAT_TIMEOUT, "heartbeat timeout")
+                return
+            self.push({"type": "ping", "data": {"ts": time.time()}})
+
+    async def _reader(self, on_message: Callable[[Dict[str, Any]], Awaitable[None]]) -> None:
+        while True:
+            try:
+                msg = await self.websocket.receive_json()
+            except WebSocketDisconnect:
+                self.close(1000, "client closed")
+                return
+            except ValueError:
+                self.push({"type": "error", "data": {"detail": "消息需为 JSON"}})
+                continue
+            self.last_seen = time.monotonic()
+            msg_type = msg.get("type") if isinstance(msg, dict) else None
+            if msg_type == "pong":
+                continue
+            if msg_type == "ping":
+                self.push({"type": "pong", "data": {"ts": time.time()}})
+                continue
+            await on_message(msg)
+
+    async def serve(
+        self,
+        on_message: Callable[[Dict[str, Any]], Awaitable[None]],
+        last_seq: int = 0,
+        resync: Optional[Callable[[], Dict[str, Any]]] = None,
+    ) -> None:
+        log = self.hub.log(self.session_id)
+        log.last_active = time.monotonic()
+        # 先挂到 hub 再取补发快照，补发期间新发布的事件进入发送缓冲，由 _send 按 seq 去重
+        self.hub.attach(self)
+        gap = log.has_gap(last_seq)
+        try:
+            if gap and resync is not None:
+                # 缺口无法补齐时改发当前完整状态，客户端据此覆盖本地快照，旧事件不再补发
+                self.sent_seq = log.seq
+                await self.websocket.send_json({"type": "resync", "data": {**resync(), "seq": log.seq}})
+            else:
+                # 补发直接写 socket，不占用发送缓冲
+                for event in log.since(last_seq):
+                    await self._send(event)
+            hello = {"session_id": self.session_id, "seq": log.seq, "gap": gap}
+            await self.websocket.send_json({"type": "hello", "data": hello})
+        except BaseException:
+            self.hub.detach(self)
+            raise
+        tasks = [
+            asyncio.create_task(self._writer()),
+            asyncio.create_task(self._heartbeat()),
+            asyncio.create_task(self._reader(on_message)),
+        ]
+        closed_wait = asyncio.create_task(self._closed.wait())
+        try:
+            await asyncio.wait([*tasks, closed_wait], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.hub.detach(self)
+            log.last_active = time.monotonic()
+            for task in [*tasks, closed_wait]:
+                task.cancel()
+            await asyncio.gather(*tasks, closed_wait, return_exceptions=True)
+            try:
+                await self.websocket.close(code=self.close_code, reason=self.close_reason)
+            except RuntimeError:
+                pass
+
+
+def spawn(coro: Awaitable[Any], registry: Set["asyncio.Task[Any]"]) -> "asyncio.Task[Any]":
+    task = asyncio.ensure_future(coro)
+    registry.add(task)
+    task.add_done_callback(registry.discard)
+    return task
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import re
+import struct
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from ..config import GENERATED_DIR, settings
+from ..services.media import MEDIA_STORE
+
+
+_MERSENNE = (1 << 61) - 1
+_NOISE_RE = re.compile(r"[\s\W_]+", re.UNICODE)
+
+
+def shingles(text: str, n: int = 2) -> Set[str]:
+    """去掉空白与标点后按字符 n-gram 切分；中文无需分词，2-gram 对“灯笼/石板路”这类短描述区分度较好。"""
+    normalized = _NOISE_RE.sub("", text.lower())
+    if len(normalized) <= n:
+        return {normalized} if normalized else set()
+    return {normalized[i : i + n] for i in range(len(normalized) - n + 1)}
+
+
+# 时间/天气/光源决定画面色调，2-gram 相似度对它们不敏感（“雨夜的老街餐馆”与“清晨的老街餐馆”估计 Jaccard 约 0.66），
+# 因此归一化成条件标签并入 namespace：条件不同的场景一律不复用，近义词（黄昏/傍晚）视为相同
+_CONDITIONS = (
+    ("dawn", ("清晨", "黎明", "拂晓", "破晓", "早晨", "早上", "晨光")),
+    ("day", ("正午", "中午", "白天", "白昼", "午后", "下午", "烈日", "上午")),
+    ("dusk", ("黄昏", "傍晚", "夕阳", "日落", "落日", "晚霞", "暮色")),
+    ("night", ("夜", "午夜", "月光", "月色", "星空", "星光")),
+    ("rain", ("雨",)),
+    ("snow", ("雪",)),
+    ("fog", ("雾",)),
+    ("storm", ("雷", "暴风")),
+    ("neon", ("霓虹",)),
+    ("fire", ("烛", "篝火", "炉火")),
+)
+
+
+def scene_conditions(text: str) -> str:
+    return "+".join(tag for tag, words in _CONDITIONS if any(w in text for w in words)) or "-"
+
+
+def _hash64(value: str) -> int:
+    return struct.unpack("<Q", hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest())[0]
+
+
+class MinHasher:
+    """num_perm 个 (a*x+b) mod p 置换近似随机排列；种子固定，签名可跨进程持久化比较。"""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        params = hashlib.blake2b(f"minhash:{seed}".encode("utf-8"), digest_size=64)
+        self.perms: List[Tuple[int, int]] = []
+        for i in range(num_perm):
+            block = hashlib.blake2b(params.digest() + i.to_bytes(4, "little"), digest_size=16).digest()
+            a, b = struct.unpack("<QQ", block)
+            self.perms.append((a % (_MERSENNE - 1) + 1, b % _MERSENNE))
+
+    def signature(self, tokens: Set[str]) -> List[int]:
+        hashes = [_hash64(t) for t in tokens] or [0]
+        return [min((a * h + b) % _MERSENNE for h in hashes) for a, b in self.perms]
+
+
+def estimate_jaccard(a: List[int], b: List[int]) -> float:
+    return sum(x == y for x, y in zip(a, b)) / len(a) if a else 0.0
+
+
+@dataclass
+class SceneEntry:
+    namespace: str
+    text: str
+    filename: str
+    signature: List[int]
+
+
+class SceneIndex:
+    """场景描述的 MinHash/LSH 近重复索引，索引项指向已渲染的场景图文件名。
+
+    namespace 区分角色外观、剧情阶段与时间/天气条件，只在同一立绘、同一阶段、同一条件下复用，
+    避免背景里出现另一个角色或把雨夜的图用于清晨。
+    索引以 JSONL 追加写入图片目录，重启后仍可复用；文件已被回收的索引项由 compact() 在媒体回收后清理。
+    """
+
+    def __init__(self, path: Path, threshold: float, num_perm: int = 64, bands: int = 16):
+        if num_perm % bands:
+            raise ValueError("num_perm 必须能被 bands 整除")
+        self.path = path
+        self.threshold = threshold
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm)
+        self.entries: List[SceneEntry] = []
+        self.buckets: Dict[Tuple[str, int, Tuple[int, ...]], List[int]] = defaultdict(list)
+        self.stats: Counter = Counter()
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def _band_keys(self, namespace: str, signature: List[int]) -> List[Tuple[str, int, Tuple[int, ...]]]:
+        return [
+            (namespace, band, tuple(signature[band * self.rows : (band + 1) * self.rows]))
+            for band in range(len(signature) // self.rows)
+        ]
+
+    def _reset(self) -> None:
+        self.entries = []
+        self.buckets = defaultdict(list)
+
+    def _insert(self, entry: SceneEntry) -> None:
+        self.entries.append(entry)
+        for key in self._band_keys(entry.namespace, entry.signature):
+            self.buckets[key].append(len(self.entries) - 1)
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path.is_file():
+            return
+        with self.path.open("r", encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    row = json.loads(line)
+                    self._insert(SceneEntry(row["ns"], row["text"], row["file"], list(row["sig"])))
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+    def lookup(self, namespace: str, text: str) -> Optional[Tuple[Path, float]]:
+        """返回相似度不低于阈值的最相似已渲染场景及其估计 Jaccard。"""
+        if not self.enabled:
+            return None
+        signature = self.hasher.signature(shingles(text))
+        with self._lock:
+            self._load()
+            self.stats["lookups"] += 1
+            candidates = {i for key in self._band_keys(namespace, signature) for i in self.buckets.get(key, ())}
+            ranked = sorted(
+                ((estimate_jaccard(signature, self.entries[i].signature), i) for i in candidates), reverse=True
+            )
+        for score, i in ranked:
+            if score < self.threshold:
+                break
+            resolved = MEDIA_STORE.resolve(self.entries[i].filename)
+            if resolved is not None:
+                with self._lock:
+                    self.stats["hits"] += 1
+                return resolved, score
+        return None
+
+    def add(self, namespace: str, text: str, image: Path) -> None:
+        if not self.enabled or not text.strip():
+            return
+        entry = SceneEntry(namespace, text, image.name, self.hasher.signature(shingles(text)))
+        row = {"ns": entry.namespace, "text": entry.text, "file": entry.filename, "sig": entry.signature}
+        with self._lock:
+            self._load()
+            self._insert(entry)
+            self.stats["indexed"] += 1
+            with self.path.open("a", encoding="utf-8") as fh:
+                fh.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def compact(self) -> int:
+        """去掉文件已不存在的索引项并重写 JSONL，返回删除条数。"""
+        with self._lock:
+            self._load()
+            kept = [e for e in self.entries if MEDIA_STORE.resolve(e.filename) is not None]
+            removed = len(self.entries) - len(kept)
+            if not removed:
+                return 0
+            self._reset()
+            for entry in kept:
+                self._insert(entry)
+            tmp = self.path.with_name(self.path.name + ".part")
+            with tmp.open("w", encoding="utf-8") as fh:
+                for e in kept:
+                    row = {"ns": e.namespace, "text": e.text, "file": e.filename, "sig": e.signature}
+                    fh.write(json.dumps(row, ensure_ascii=False) + "\n")
+            os.replace(tmp, self.path)
+            self.stats["pruned"] += removed
+            return removed
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            lookups, hits = self.stats["lookups"], self.stats["hits"]
+            return {
+                "enabled": self.enabled,
+                "threshold": self.threshold,
+                "entries": len(self.entries),
+                "pruned": self.stats["pruned"],
+                "lookups": lookups,
+                "reused": hits,
+                "image_calls_saved": hits,
+                "reuse_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+@lru_cache(maxsize=256)
+def _file_digest(path: str, mtime_ns: int) -> str:
+    return hashlib.sha1(Path(path).read_bytes()).hexdigest()
+
+
+def scene_namespace(portrait: Optional[Path], appearance: str, stage: str, scene: str) -> str:
+    """有立绘时按立绘内容区分（立绘相同的会话之间可共享场景），否则按外貌描述区分；再按阶段与时间/天气条件细分。"""
+    if portrait is not None and portrait.is_file():
+        identity = "img:" + _file_digest(portrait.as_posix(), portrait.stat().st_mtime_ns)
+    else:
+        identity = "txt:" + hashlib.sha1(appearance.encode("utf-8")).hexdigest()
+    return f"{identity}|{stage}|{scene_conditions(scene)}"
+
+
+SCENE_INDEX = SceneIndex(GENERATED_DIR / "scene_index.jsonl", threshold=settings.scene_reuse_threshold)
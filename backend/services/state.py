@@ -36,6 +36,7 @@ def state_from_agent(agent: GalGameAgent) -> Dict[str, Any]:
         },
         "affection": agent.affection,
         "current_node_id": agent.current_node_id,
+        "pending_options": agent.pending_options,
     }
 
 
@@ -43,3 +44,4 @@ def load_state(agent: GalGameAgent, state: Dict[str, Any]) -> None:
     agent.worldbook = parse_worldbook(state["worldbook"])
     agent.affection = int(state.get("affection", 0))
     agent.current_node_id = str(state.get("current_node_id"))
+    agent.pending_options = dict(state.get("pending_options") or {})
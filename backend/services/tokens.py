@@ -0,0 +1,142 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from ..config import settings
+from ..services.media import MEDIA_STORE
+
+
+TOKEN_VERSION = 1
+SESSION_MODES = ("memory", "token")
+
+
+class SessionTokenError(ValueError):
+    pass
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def parse_keys(raw: str) -> List[Tuple[str, bytes]]:
+    """解析 "kid:secret,kid2:secret2"；第一把为签发密钥，其余仅用于校验（轮换期间的旧密钥）。"""
+    keys: List[Tuple[str, bytes]] = []
+    for item in filter(None, (x.strip() for x in raw.split(","))):
+        kid, _, secret = item.partition(":")
+        if not kid or not secret or "." in kid:
+            raise ValueError(f"GALGAME_SESSION_KEYS 格式错误: {item!r}")
+        keys.append((kid, secret.encode("utf-8")))
+    return keys
+
+
+def _compact(session: Dict[str, Any]) -> Dict[str, Any]:
+    """只保留重建会话所需的字段；图片只记文件名，由 MediaStore 还原路径与 URL。"""
+
+    def name(path: str) -> str:
+        return Path(path).name if path else ""
+
+    return {
+        "st": session["state"],
+        "p": name(session.get("portrait_path", "")),
+        "sc": {node_id: name(p) for node_id, p in (session.get("scene_paths") or {}).items() if p},
+        "cur": session.get("scene_url", "").rsplit("/", 1)[-1],
+        "cg": session.get("final_cg_url", "").rsplit("/", 1)[-1],
+        "rev": session.get("rev", 0),
+    }
+
+
+def _expand(compact: Dict[str, Any], media_route: str) -> Dict[str, Any]:
+    def path(filename: str) -> str:
+        resolved = MEDIA_STORE.resolve(filename) if filename else None
+        return resolved.as_posix() if resolved else ""
+
+    def url(filename: str) -> str:
+        return f"{media_route}/{filename}" if filename else ""
+
+    scene_paths = {node_id: path(f) for node_id, f in (compact.get("sc") or {}).items()}
+    return {
+        "state": compact["st"],
+        "char_url": url(compact.get("p", "")),
+        "scene_url": url(compact.get("cur", "")),
+        "bg_url": url(compact.get("cur", "")),
+        "final_cg_url": url(compact.get("cg", "")),
+        "portrait_path": path(compact.get("p", "")),
+        "scene_paths": {k: v for k, v in scene_paths.items() if v},
+        "rev": int(compact.get("rev", 0)),
+        "last_played": time.time(),
+    }
+
+
+class SessionTokenCodec:
+    """会话状态 -> 紧凑 JSON -> zlib -> HMAC-SHA256 签名，格式为 <kid>.<payload>.<mac>（base64url）。"""
+
+    def __init__(self, keys: List[Tuple[str, bytes]], max_bytes: int, ttl_seconds: float, media_route: str = "/media"):
+        self.keys = dict(keys)
+        self.active_kid = keys[0][0] if keys else ""
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.media_route = media_route
+
+    def _mac(self, kid: str, body: bytes) -> bytes:
+        return hmac.new(self.keys[kid], kid.encode("ascii") + b"." + body, hashlib.sha256).digest()
+
+    def encode(self, session_id: str, session: Dict[str, Any]) -> str:
+        if not self.active_kid:
+            raise SessionTokenError("GALGAME_SESSION_KEYS 未设置，无法签发会话令牌")
+        payload = {"v": TOKEN_VERSION, "sid": session_id, "iat": int(time.time()), "s": _compact(session)}
+        raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        body = zlib.compress(raw, 6)
+        token = f"{self.active_kid}.{_b64encode(body)}.{_b64encode(self._mac(self.active_kid, body))}"
+        if len(token) > self.max_bytes:
+            raise SessionTokenError(f"会话令牌过大: {len(token)} > {self.max_bytes} 字节")
+        return token
+
+    def decode(self, token: str) -> Tuple[str, Dict[str, Any]]:
+        if len(token) > self.max_bytes:
+            raise SessionTokenError("会话令牌过大")
+        try:
+            kid, body_text, mac_text = token.split(".")
+            body = _b64decode(body_text)
+            mac = _b64decode(mac_text)
+        except ValueError as e:
+            raise SessionTokenError("会话令牌格式错误") from e
+        if kid not in self.keys or not hmac.compare_digest(mac, self._mac(kid, body)):
+            raise SessionTokenError("会话令牌签名无效")
+        # 限制解压后大小，防止压缩炸弹
+        inflater = zlib.decompressobj()
+        try:
+            raw = inflater.decompress(body, self.max_bytes * 64)
+        except zlib.error as e:
+            raise SessionTokenError("会话令牌数据损坏") from e
+        if inflater.unconsumed_tail:
+            raise SessionTokenError("会话令牌解压后过大")
+        payload = json.loads(raw.decode("utf-8"))
+        if payload.get("v") != TOKEN_VERSION:
+            raise SessionTokenError("会话令牌版本不支持")
+        if self.ttl_seconds > 0 and time.time() - payload.get("iat", 0) > self.ttl_seconds:
+            raise SessionTokenError("会话令牌已过期")
+        return str(payload["sid"]), _expand(payload["s"], self.media_route)
+
+
+def check_session_mode(mode: str, codec: SessionTokenCodec) -> None:
+    """启动时校验会话模式，避免拼错模式静默退回内存会话，或 token 模式缺密钥到签发时才报 500。"""
+    if mode not in SESSION_MODES:
+        raise ValueError(f"GALGAME_SESSION_MODE 只能是 {'/'.join(SESSION_MODES)}: {mode!r}")
+    if mode == "token" and not codec.active_kid:
+        raise ValueError("GALGAME_SESSION_MODE=token 需要设置 GALGAME_SESSION_KEYS")
+
+
+SESSION_CODEC = SessionTokenCodec(
+    parse_keys(settings.session_keys),
+    max_bytes=settings.session_token_max_bytes,
+    ttl_seconds=settings.session_ttl_hours * 3600,
+)
@@ -0,0 +1,244 @@
+import gzip
+import json
+import logging
+import logging.handlers
+import queue
+import time
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from .config import settings
+
+
+TURN_LOGGER = "galgame.turn"
+PROVIDER_LOGGER = "galgame.provider"
+MEDIA_LOGGER = "galgame.media"
+BATCH_LOGGER = "galgame.batch"
+TRANSCRIPT_LOGGER = "galgame.transcript"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+@dataclass
+class TurnTrace:
+    session_id: str
+    channel: str
+    fields: Dict[str, Any] = field(default_factory=dict)
+    providers: List[Dict[str, Any]] = field(default_factory=list)
+    error: str = ""
+
+    def update(self, **kwargs: Any) -> None:
+        self.fields.update(kwargs)
+
+
+_SESSION: ContextVar[str] = ContextVar("galgame_session", default="")
+_TRACE: ContextVar[Optional[TurnTrace]] = ContextVar("galgame_trace", default=None)
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "payload", {}) or {})
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SessionSampler(logging.Filter):
+    """按会话整体采样，保证被采中的会话日志完整；WARNING 及以上始终保留。"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = max(0.0, min(1.0, rate))
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.rate >= 1.0:
+            return True
+        session_id = (getattr(record, "payload", {}) or {}).get("session_id", "")
+        if not session_id:
+            return self.rate > 0
+        return (zlib.crc32(session_id.encode()) % 10000) < self.rate * 10000
+
+
+class GzipTranscriptHandler(logging.Handler):
+    """每个会话一个 gzip JSONL；每条记录追加为独立 gzip member，可直接 zcat 读取。"""
+
+    def __init__(self, directory: Path):
+        super().__init__()
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        payload = getattr(record, "payload", {}) or {}
+        session_id = payload.get("session_id")
+        if not session_id:
+            return
+        try:
+            with gzip.open(transcript_path(session_id), "at", encoding="utf-8") as fh:
+                fh.write(json.dumps(payload, ensure_ascii=False, default=str) + "\n")
+        except Exception:
+            self.handleError(record)
+
+
+def _file_handler() -> logging.Handler:
+    settings.log_file.parent.mkdir(parents=True, exist_ok=True)
+    if settings.log_rotate_when:
+        return logging.handlers.TimedRotatingFileHandler(
+            settings.log_file,
+            when=settings.log_rotate_when,
+            backupCount=settings.log_backup_count,
+            encoding="utf-8",
+            utc=True,
+        )
+    return logging.handlers.RotatingFileHandler(
+        settings.log_file,
+        maxBytes=settings.log_max_bytes,
+        backupCount=settings.log_backup_count,
+        encoding="utf-8",
+    )
+
+
+def transcript_path(session_id: str) -> Path:
+    assert settings.transcript_dir is not None, "GALGAME_TRANSCRIPT_DIR 未设置"
+    return settings.transcript_dir / f"{session_id}.jsonl.gz"
+
+
+def start_logging(console: bool = False) -> None:
+    """把 galgame.* 日志经队列交给后台线程写盘，事件循环只做一次 put_nowait。
+
+    console=True 时 WARNING 及以上同时以 JSON 行输出到 stderr，供命令行工具使用。
+    """
+    global _listener
+    if _listener is not None:
+        return
+    file_handler = _file_handler()
+    file_handler.setFormatter(JSONFormatter())
+    file_handler.addFilter(lambda record: record.name != TRANSCRIPT_LOGGER)
+    file_handler.addFilter(SessionSampler(settings.log_sample_rate))
+    handlers: List[logging.Handler] = [file_handler]
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.WARNING)
+        console_handler.setFormatter(JSONFormatter())
+        console_handler.addFilter(lambda record: record.name != TRANSCRIPT_LOGGER)
+        handlers.append(console_handler)
+    if settings.transcript_dir is not None:
+        transcript_handler = GzipTranscriptHandler(settings.transcript_dir)
+        transcript_handler.addFilter(lambda record: record.name == TRANSCRIPT_LOGGER)
+        handlers.append(transcript_handler)
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=settings.log_queue_size)
+    root = logging.getLogger("galgame")
+    root.setLevel(logging.INFO)
+    root.propagate = False
+    root.handlers = [_DroppingQueueHandler(log_queue)]
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+@contextmanager
+def cli_logging() -> Iterator[None]:
+    """命令行入口使用：启动日志并在退出前写完队列中的记录。"""
+    start_logging(console=True)
+    try:
+        yield
+    finally:
+        stop_logging()
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列写满时丢弃日志而不是阻塞事件循环。"""
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def _emit(logger_name: str, event: str, payload: Dict[str, Any], level: int = logging.INFO) -> None:
+    logging.getLogger(logger_name).log(level, event, extra={"payload": payload})
+
+
+def log_event(logger_name: str, event: str, payload: Dict[str, Any], level: int = logging.INFO) -> None:
+    _emit(logger_name, event, payload, level)
+
+
+def record_provider(
+    role: str,
+    elapsed: float,
+    prompt_chars: int = 0,
+    output_chars: int = 0,
+    error: Optional[BaseException] = None,
+) -> None:
+    entry = {
+        "session_id": _SESSION.get(),
+        "role": role,
+        "latency_ms": round(elapsed * 1000, 1),
+        "prompt_chars": prompt_chars,
+        "output_chars": output_chars,
+        "ok": error is None,
+    }
+    if error is not None:
+        entry["error"] = repr(error)
+    trace = _TRACE.get()
+    if trace is not None:
+        trace.providers.append(entry)
+    _emit(PROVIDER_LOGGER, "provider_call", entry, logging.WARNING if error else logging.INFO)
+
+
+@contextmanager
+def trace_turn(session_id: str, channel: str) -> Iterator[TurnTrace]:
+    trace = TurnTrace(session_id=session_id, channel=channel)
+    session_token = _SESSION.set(session_id)
+    trace_token = _TRACE.set(trace)
+    started = time.perf_counter()
+    try:
+        yield trace
+    except Exception as e:
+        trace.error = repr(e)
+        raise
+    finally:
+        _TRACE.reset(trace_token)
+        _SESSION.reset(session_token)
+        entry = {
+            "session_id": session_id,
+            "channel": channel,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            **trace.fields,
+            "providers": [{k: p[k] for k in ("role", "latency_ms", "prompt_chars", "ok")} for p in trace.providers],
+        }
+        if trace.error:
+            entry["error"] = trace.error
+        _emit(TURN_LOGGER, "turn", entry, logging.ERROR if trace.error else logging.INFO)
+
+
+def record_transcript(session_id: str, entry: Dict[str, Any]) -> None:
+    if settings.transcript_dir is None:
+        return
+    _emit(TRANSCRIPT_LOGGER, "transcript", {"session_id": session_id, "ts": time.time(), **entry})
+
+
+@contextmanager
+def session_scope(session_id: str) -> Iterator[None]:
+    token = _SESSION.set(session_id)
+    try:
+        yield
+    finally:
+        _SESSION.reset(token)
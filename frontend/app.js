@@ -1,8 +1,19 @@
 const API_BASE = "/api/v1";
+const SNAPSHOT_KEY = "galgame.session";
 
 let sessionId = null;
+let sessionToken = "";
 let history = [];
 let blueprintNodes = [];
+let snapshot = {};
+const preloaded = new Set();
+let socket = null;
+let lastSeq = 0;
+let reconnectDelay = 1000;
+let reconnectTimer = null;
+let failedHandshakes = 0;
+const MAX_FAILED_HANDSHAKES = 5;
+let streaming = false;
 
 const els = {
   startBtn: document.getElementById("start-btn"),
@@ -31,17 +42,101 @@ const els = {
   copyLog: document.getElementById("copy-log"),
 };
 
-function cacheBust(url) {
-  return url ? `${url}${url.includes("?") ? "&" : "?"}${Date.now()}` : "";
-}
-
 function setScene(url) {
   if (!url) {
     els.bgImage.style.display = "none";
     return;
   }
   els.bgImage.style.display = "block";
-  els.bgImage.src = cacheBust(url);
+  els.bgImage.src = url;
+}
+
+function preloadAssets(urls) {
+  const fresh = (urls || []).filter((u) => u && !preloaded.has(u));
+  if (!fresh.length) return;
+  fresh.forEach((u) => preloaded.add(u));
+  const sw = navigator.serviceWorker && navigator.serviceWorker.controller;
+  if (sw) {
+    sw.postMessage({ type: "preload", urls: fresh });
+    return;
+  }
+  fresh.forEach((u) => {
+    const img = new Image();
+    img.src = u;
+  });
+}
+
+async function refreshAssets() {
+  if (!sessionId) return;
+  try {
+    const query = sessionToken ? `?token=${encodeURIComponent(sessionToken)}` : "";
+    const res = await fetch(`${API_BASE}/game/${sessionId}/assets${query}`);
+    if (!res.ok) return;
+    const manifest = await res.json();
+    preloadAssets(manifest.urls);
+  } catch {
+    // 离线或会话已失效时仅依赖本地缓存
+  }
+}
+
+function saveSnapshot(patch) {
+  snapshot = { ...snapshot, ...patch, sessionId, sessionToken, history, blueprint: blueprintNodes };
+  try {
+    localStorage.setItem(SNAPSHOT_KEY, JSON.stringify(snapshot));
+  } catch {
+    // 存储已满或被禁用时忽略
+  }
+}
+
+function renderOptions(opts) {
+  [els.choiceA, els.choiceB].forEach((btn, i) => {
+    const text = (opts || [])[i];
+    if (!text) {
+      btn.style.display = "none";
+      return;
+    }
+    btn.textContent = text;
+    btn.style.display = "inline-flex";
+    btn.onclick = () => sendInput(text);
+  });
+}
+
+function restoreSnapshot() {
+  let saved = null;
+  try {
+    saved = JSON.parse(localStorage.getItem(SNAPSHOT_KEY) || "null");
+  } catch {
+    saved = null;
+  }
+  if (!saved || !saved.sessionId) return;
+  snapshot = saved;
+  sessionId = saved.sessionId;
+  sessionToken = saved.sessionToken || "";
+  lastSeq = saved.lastSeq || 0;
+  history = saved.history || [];
+  blueprintNodes = saved.blueprint || [];
+  els.charName.textContent = saved.name || "角色";
+  els.dialogueName.textContent = saved.name || "角色";
+  els.dialogueText.textContent = saved.dialogue || "......";
+  els.affection.textContent = `好感度 ${saved.affection ?? "-"}`;
+  els.nodeLabel.textContent = `节点 ${saved.current_node_id ?? "-"}`;
+  els.logicText.textContent = saved.logic_reason || "-";
+  els.worldView.textContent = saved.world_view || "-";
+  els.traitAppearance.textContent = saved.appearance || "-";
+  els.traitPersonality.textContent = JSON.stringify(saved.personality || {});
+  els.traitBackground.textContent = saved.background_setting || "-";
+  setScene(saved.scene_url || "");
+  renderOptions(saved.options);
+  renderConv();
+  renderBlueprint();
+  setOverlay("");
+  refreshAssets();
+  connectSocket();
+}
+
+function registerServiceWorker() {
+  if (!("serviceWorker" in navigator)) return;
+  navigator.serviceWorker.register("./sw.js").catch(() => {});
 }
 
 function setOverlay(msg) {
@@ -107,12 +202,14 @@ async function startGame() {
     if (!res.ok) throw new Error("start failed");
     const data = await res.json();
     sessionId = data.session_id;
+    sessionToken = data.session_token || "";
     els.charName.textContent = data.name || "角色";
     els.dialogueName.textContent = data.name || "角色";
     els.dialogueText.textContent = data.opening || "......";
     els.affection.textContent = `好感度 ${data.affection ?? "-"}`;
     els.nodeLabel.textContent = `节点 ${data.current_node_id ?? "-"}`;
     setScene(data.scene_url || data.bg_url || "");
+    preloadAssets([data.char_url, data.scene_url]);
     els.startHint.textContent = "";
     els.worldView.textContent = data.world_view || "-";
     els.traitAppearance.textContent = data.appearance || "-";
@@ -122,6 +219,25 @@ async function startGame() {
     renderBlueprint();
     history = [];
     if (data.opening) appendHistory("actor", data.opening);
+    renderOptions([]);
+    snapshot = {};
+    saveSnapshot({
+      name: data.name,
+      dialogue: data.opening,
+      affection: data.affection,
+      current_node_id: data.current_node_id,
+      scene_url: data.scene_url || data.bg_url || "",
+      world_view: data.world_view,
+      appearance: data.appearance,
+      personality: data.personality,
+      background_setting: data.background_setting,
+      options: [],
+      logic_reason: "",
+    });
+    refreshAssets();
+    lastSeq = 0;
+    failedHandshakes = 0;
+    connectSocket();
   } catch (err) {
     els.startHint.textContent = "启动失败，请检查 .env 与后端";
   } finally {
@@ -129,6 +245,138 @@ async function startGame() {
   }
 }
 
+function applyTurn(data) {
+  if (data.session_token) sessionToken = data.session_token;
+  els.dialogueText.textContent = data.dialogue || "";
+  els.affection.textContent = `好感度 ${data.affection ?? "-"}`;
+  els.nodeLabel.textContent = `节点 ${data.current_node_id ?? "-"}`;
+  els.logicText.textContent = data.logic_reason || "-";
+  const sceneUrl = data.final_cg_url || data.scene_url || data.bg_url || "";
+  setScene(sceneUrl);
+  preloadAssets([data.char_url, data.scene_url, data.final_cg_url]);
+  appendHistory("actor", data.dialogue || "");
+  if (data.logic_reason) appendHistory("director", data.logic_reason);
+  renderOptions(data.options);
+  saveSnapshot({
+    dialogue: data.dialogue,
+    affection: data.affection,
+    current_node_id: data.current_node_id,
+    scene_url: sceneUrl,
+    final_cg_url: data.final_cg_url || "",
+    options: data.options || [],
+    logic_reason: data.logic_reason,
+  });
+  refreshAssets();
+}
+
+function handleEvent(ev) {
+  if (ev.seq) {
+    lastSeq = Math.max(lastSeq, ev.seq);
+    snapshot.lastSeq = lastSeq;
+  }
+  const data = ev.data || {};
+  switch (ev.type) {
+    case "ping":
+      if (socket && socket.readyState === WebSocket.OPEN) socket.send(JSON.stringify({ type: "pong" }));
+      break;
+    case "hello":
+      reconnectDelay = 1000;
+      break;
+    case "state":
+      els.affection.textContent = `好感度 ${data.affection ?? "-"}`;
+      els.nodeLabel.textContent = `节点 ${data.current_node_id ?? "-"}`;
+      els.logicText.textContent = data.logic_reason || "-";
+      break;
+    case "dialogue":
+      if (!streaming) {
+        els.dialogueText.textContent = "";
+        streaming = true;
+      }
+      els.dialogueText.textContent += data.text || "";
+      break;
+    case "turn":
+      streaming = false;
+      applyTurn(data);
+      setOverlay("");
+      break;
+    case "resync": {
+      // 服务端事件缓冲已无法补齐断线期间的事件，直接采用完整状态
+      streaming = false;
+      lastSeq = data.seq || 0;
+      snapshot.lastSeq = lastSeq;
+      if (data.session_token) sessionToken = data.session_token;
+      els.affection.textContent = `好感度 ${data.affection ?? "-"}`;
+      els.nodeLabel.textContent = `节点 ${data.current_node_id ?? "-"}`;
+      const sceneUrl = data.final_cg_url || data.scene_url || "";
+      if (sceneUrl) setScene(sceneUrl);
+      preloadAssets(data.urls || []);
+      renderOptions(data.options);
+      saveSnapshot({
+        affection: data.affection,
+        current_node_id: data.current_node_id,
+        scene_url: sceneUrl,
+        final_cg_url: data.final_cg_url || "",
+        options: data.options || [],
+      });
+      setOverlay("");
+      break;
+    }
+    case "token":
+      sessionToken = data.session_token || sessionToken;
+      saveSnapshot({});
+      break;
+    case "asset":
+      preloadAssets([data.url]);
+      if (data.kind === "final_cg") {
+        setScene(data.url);
+        saveSnapshot({ scene_url: data.url, final_cg_url: data.url });
+      } else if (!snapshot.final_cg_url && String(data.node_id) === String(snapshot.current_node_id)) {
+        setScene(data.url);
+        saveSnapshot({ scene_url: data.url });
+      }
+      break;
+    case "error":
+      streaming = false;
+      appendHistory("director", data.detail || "请求失败，请检查后端与密钥配置");
+      setOverlay("");
+      break;
+    default:
+      break;
+  }
+}
+
+function connectSocket() {
+  if (!sessionId || !("WebSocket" in window)) return;
+  clearTimeout(reconnectTimer);
+  if (socket) {
+    socket.onclose = null;
+    socket.close();
+  }
+  const proto = location.protocol === "https:" ? "wss:" : "ws:";
+  const token = sessionToken ? `&token=${encodeURIComponent(sessionToken)}` : "";
+  const ws = new WebSocket(`${proto}//${location.host}${API_BASE}/game/ws/${sessionId}?last_seq=${lastSeq}${token}`);
+  let greeted = false;
+  ws.onmessage = (msg) => {
+    greeted = true;
+    try {
+      handleEvent(JSON.parse(msg.data));
+    } catch {
+      // 忽略无法解析的帧
+    }
+  };
+  ws.onclose = (e) => {
+    if (socket !== ws) return;
+    socket = null;
+    if (e.code === 4404 || e.code === 4401) return;
+    // 连续多次未收到任何服务端消息就断开（握手失败、代理拦截等），改用 HTTP 通道
+    failedHandshakes = greeted ? 0 : failedHandshakes + 1;
+    if (failedHandshakes >= MAX_FAILED_HANDSHAKES) return;
+    reconnectTimer = setTimeout(connectSocket, reconnectDelay);
+    reconnectDelay = Math.min(reconnectDelay * 2, 30000);
+  };
+  socket = ws;
+}
+
 async function sendInput(text) {
   if (!sessionId) {
     alert("请先点击“开始一段新故事”");
@@ -140,36 +388,19 @@ async function sendInput(text) {
   els.choiceA.style.display = "none";
   els.choiceB.style.display = "none";
   setOverlay("角色思考中...");
+  if (socket && socket.readyState === WebSocket.OPEN) {
+    streaming = false;
+    socket.send(JSON.stringify({ type: "input", user_input: text }));
+    return;
+  }
   try {
     const res = await fetch(`${API_BASE}/game/chat`, {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ session_id: sessionId, user_input: text }),
+      body: JSON.stringify({ session_id: sessionId, user_input: text, session_token: sessionToken || null }),
     });
     if (!res.ok) throw new Error("chat failed");
-    const data = await res.json();
-    els.dialogueText.textContent = data.dialogue || "";
-    els.affection.textContent = `好感度 ${data.affection ?? "-"}`;
-    els.nodeLabel.textContent = `节点 ${data.current_node_id ?? "-"}`;
-    els.logicText.textContent = data.logic_reason || "-";
-    if (data.final_cg_url) {
-      setScene(data.final_cg_url);
-    } else {
-      setScene(data.scene_url || data.bg_url || "");
-    }
-    appendHistory("actor", data.dialogue || "");
-    if (data.logic_reason) appendHistory("director", data.logic_reason);
-    const opts = data.options || [];
-    if (opts[0]) {
-      els.choiceA.textContent = opts[0];
-      els.choiceA.style.display = "inline-flex";
-      els.choiceA.onclick = () => sendInput(opts[0]);
-    }
-    if (opts[1]) {
-      els.choiceB.textContent = opts[1];
-      els.choiceB.style.display = "inline-flex";
-      els.choiceB.onclick = () => sendInput(opts[1]);
-    }
+    applyTurn(await res.json());
   } catch (err) {
     appendHistory("director", "请求失败，请检查后端与密钥配置");
   } finally {
@@ -199,3 +430,5 @@ renderConv();
 renderBlueprint();
 setScene("");
 wireEvents();
+registerServiceWorker();
+restoreSnapshot();
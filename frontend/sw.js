@@ -0,0 +1,86 @@
+const MEDIA_CACHE = "galgame-media-v1";
+const SHELL_CACHE = "galgame-shell-v1";
+const MEDIA_PREFIX = "/media/";
+const MEDIA_MAX_ENTRIES = 120;
+const SHELL_ASSETS = ["./", "./index.html", "./app.js", "./styles.css"];
+
+self.addEventListener("install", (event) => {
+  event.waitUntil(
+    caches
+      .open(SHELL_CACHE)
+      .then((cache) => cache.addAll(SHELL_ASSETS))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener("activate", (event) => {
+  const keep = new Set([MEDIA_CACHE, SHELL_CACHE]);
+  event.waitUntil(
+    caches
+      .keys()
+      .then((names) => Promise.all(names.filter((n) => !keep.has(n)).map((n) => caches.delete(n))))
+      .then(() => self.clients.claim())
+  );
+});
+
+// Cache.keys() 按插入顺序返回，命中时重新写入即可近似 LRU。
+async function trimMedia(cache) {
+  const keys = await cache.keys();
+  const overflow = keys.length - MEDIA_MAX_ENTRIES;
+  for (let i = 0; i < overflow; i += 1) {
+    await cache.delete(keys[i]);
+  }
+}
+
+async function mediaFirst(request) {
+  const cache = await caches.open(MEDIA_CACHE);
+  const hit = await cache.match(request, { ignoreSearch: true });
+  if (hit) {
+    await cache.delete(request, { ignoreSearch: true });
+    await cache.put(request.url.split("?")[0], hit.clone());
+    return hit;
+  }
+  const res = await fetch(request);
+  if (res.ok) {
+    await cache.put(request.url.split("?")[0], res.clone());
+    await trimMedia(cache);
+  }
+  return res;
+}
+
+async function shellNetworkFirst(request) {
+  const cache = await caches.open(SHELL_CACHE);
+  try {
+    const res = await fetch(request);
+    if (res.ok) await cache.put(request, res.clone());
+    return res;
+  } catch (err) {
+    const hit = await cache.match(request, { ignoreSearch: true });
+    if (hit) return hit;
+    throw err;
+  }
+}
+
+self.addEventListener("fetch", (event) => {
+  const { request } = event;
+  if (request.method !== "GET") return;
+  const url = new URL(request.url);
+  if (url.origin !== self.location.origin) return;
+  if (url.pathname.startsWith(MEDIA_PREFIX)) {
+    event.respondWith(mediaFirst(request));
+    return;
+  }
+  if (url.pathname.startsWith(new URL(self.registration.scope).pathname)) {
+    event.respondWith(shellNetworkFirst(request));
+  }
+});
+
+self.addEventListener("message", (event) => {
+  const data = event.data || {};
+  if (data.type !== "preload" || !Array.isArray(data.urls)) return;
+  event.waitUntil(
+    Promise.all(
+      data.urls.map((u) => mediaFirst(new Request(new URL(u, self.location.origin).toString())).catch(() => null))
+    )
+  );
+});
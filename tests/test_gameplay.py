@@ -0,0 +1,182 @@
+import asyncio
+import json
+from typing import List, Optional
+
+import pytest
+
+from ..backend.models import parse_worldbook
+from ..backend.services import gameplay
+from ..backend.services.gameplay import GalGameAgent, dynamic_update, fused_turn, option_fast_path, roleplay_turn
+from ..backend.services.state import load_state, state_from_agent
+from ..backend.services.tokens import SessionTokenCodec, parse_keys
+
+
+SID = "0" * 32
+
+
+class FakeLLM:
+    def __init__(self, *outputs: object):
+        self.outputs = [o if isinstance(o, str) else json.dumps(o, ensure_ascii=False) for o in outputs]
+        self.prompts: List[str] = []
+
+    def __call__(self, prompt: str) -> str:
+        self.prompts.append(prompt)
+        return self.outputs.pop(0)
+
+
+def _agent(llm2: Optional[FakeLLM] = None, llm3: Optional[FakeLLM] = None, affection: int = 20) -> GalGameAgent:
+    agent = GalGameAgent(FakeLLM(), llm2 or FakeLLM(), llm3 or FakeLLM())
+    agent.worldbook = parse_worldbook(
+        {
+            "角色特征": {"名字": "小雨", "外貌": "短发", "好感度": affection},
+            "世界观": "老街",
+            "剧本蓝图": {
+                "node": [
+                    {"ID": "1", "label": "初遇", "scene": "清晨的老街", "affection_threshold": 0},
+                    {"ID": "2", "label": "熟悉", "scene": "黄昏的天台", "affection_threshold": 30},
+                    {"ID": "3", "label": "告白", "scene": "雨夜的车站", "affection_threshold": 60},
+                ]
+            },
+        }
+    )
+    agent.affection = affection
+    agent.current_node_id = agent._select_node_for_affection(affection)
+    return agent
+
+
+def test_option_effect_clamps_predicted_delta():
+    assert gameplay._option_effect({"affection_delta": 40, "stage_effect": "拥抱"}) == {
+        "affection_delta": 15,
+        "stage_effect": "拥抱",
+    }
+    assert gameplay._option_effect({"affection_delta": -99})["affection_delta"] == -15
+    assert gameplay._option_effect({"affection_delta": "很多"}) is None
+    assert gameplay._option_effect("+5") is None
+
+
+def test_fast_path_moves_to_node_for_new_affection():
+    agent = _agent(affection=20)
+    agent.pending_options = {"陪她去天台": {"affection_delta": 15, "stage_effect": "关系拉近"}}
+
+    result = option_fast_path(agent, agent.affection, "  陪她去天台 ")
+
+    assert result == (35, "2", "选项预判：好感度 +15。关系拉近", {})
+    assert (agent.affection, agent.current_node_id) == (35, "2")
+    assert option_fast_path(agent, agent.affection, "自由输入") is None
+
+
+def test_dynamic_update_skips_director_when_option_matches(monkeypatch):
+    monkeypatch.setattr(gameplay, "UPDATE_COUNTERS", gameplay.Counter())
+    llm2 = FakeLLM({"affection": 25, "logic_reason": "闲聊"})
+    agent = _agent(llm2=llm2, affection=20)
+    agent.pending_options = {"转身离开": {"affection_delta": -10, "stage_effect": "气氛冷淡"}}
+
+    affection, node_id, _, _ = asyncio.run(dynamic_update(agent, 20, "1", "转身离开"))
+    assert (affection, node_id, agent.last_update_source) == (10, "1", "option")
+    assert llm2.prompts == []
+
+    asyncio.run(dynamic_update(agent, agent.affection, agent.current_node_id, "今天天气不错"))
+    assert len(llm2.prompts) == 1
+    assert agent.last_update_source == "director"
+    assert gameplay.UPDATE_COUNTERS == {"option": 1, "director": 1}
+
+
+def test_pending_options_survive_state_and_token_round_trip():
+    agent = _agent()
+    agent.pending_options = {"陪她去天台": {"affection_delta": 15, "stage_effect": "关系拉近"}}
+    codec = SessionTokenCodec(parse_keys("k1:secret"), max_bytes=32768, ttl_seconds=0)
+    token = codec.encode(SID, {"state": state_from_agent(agent), "rev": 1})
+
+    _, session = codec.decode(token)
+    restored = _agent(affection=0)
+    load_state(restored, session["state"])
+
+    assert restored.pending_options == agent.pending_options
+    assert option_fast_path(restored, restored.affection, "陪她去天台")[:2] == (35, "2")
+
+
+DIRECTOR = {
+    "affection": 45,
+    "logic_reason": "玩家主动陪伴",
+    "is_custom_node": True,
+    "node_extension": {"id": "2b", "label": "天台谈心", "details": "", "scene": "黄昏的天台", "affection_threshold": 40},
+}
+ROLEPLAY = {
+    "对话回应": "谢谢你陪我。",
+    "表情": "微笑",
+    "行为": "靠近",
+    "option_a": "握住她的手",
+    "option_b": "岔开话题",
+    "option_a_effect": {"affection_delta": 8, "stage_effect": "关系升温"},
+    "option_b_effect": {"affection_delta": -5, "stage_effect": "气氛冷却"},
+}
+
+
+def test_fused_turn_applies_director_and_roleplay_in_one_call(monkeypatch):
+    monkeypatch.setattr(gameplay, "UPDATE_COUNTERS", gameplay.Counter())
+    llm2, llm3 = FakeLLM(), FakeLLM({**DIRECTOR, **ROLEPLAY})
+    agent = _agent(llm2=llm2, llm3=llm3, affection=20)
+
+    (affection, node_id, reason, node_ext), rp = asyncio.run(fused_turn(agent, 20, "1", "陪你看夕阳"))
+
+    assert (affection, node_id, reason) == (45, "2b", "玩家主动陪伴")
+    assert node_ext["scene"] == "黄昏的天台"
+    assert rp["dialogue"] == "谢谢你陪我。" and rp["option_a"] == "握住她的手"
+    assert agent.pending_options["岔开话题"] == {"affection_delta": -5, "stage_effect": "气氛冷却"}
+    assert agent.last_update_source == "fused"
+    assert (len(llm2.prompts), len(llm3.prompts)) == (0, 1)
+    assert gameplay.UPDATE_COUNTERS == {"fused": 1}
+
+
+def test_fused_turn_matches_two_call_path():
+    split = _agent(llm2=FakeLLM(DIRECTOR), llm3=FakeLLM(ROLEPLAY), affection=20)
+    director = asyncio.run(dynamic_update(split, 20, "1", "陪你看夕阳"))
+    rp = asyncio.run(roleplay_turn(split, director[0], director[1], "陪你看夕阳"))
+
+    fused = _agent(llm3=FakeLLM({**DIRECTOR, **ROLEPLAY}), affection=20)
+    assert asyncio.run(fused_turn(fused, 20, "1", "陪你看夕阳")) == (director, rp)
+    assert state_from_agent(fused) == state_from_agent(split)
+
+
+def test_fused_turn_defaults_missing_fields():
+    agent = _agent(llm3=FakeLLM({}), affection=35)
+    agent.pending_options = {"旧选项": {"affection_delta": 5, "stage_effect": ""}}
+
+    (affection, node_id, reason, node_ext), rp = asyncio.run(fused_turn(agent, 35, "2", "嗯"))
+
+    assert (affection, node_id, reason, node_ext) == (35, "2", "", {})
+    assert rp == {"dialogue": "", "expression": "", "movement": "", "option_a": "", "option_b": ""}
+    assert agent.pending_options == {}
+
+
+@pytest.mark.parametrize(
+    "output",
+    [
+        "不是 JSON",
+        [DIRECTOR],
+        {**ROLEPLAY, "affection": "很高"},
+        {**ROLEPLAY, "is_custom_node": True, "node_extension": {"label": "缺少 id"}},
+        {**ROLEPLAY, "is_custom_node": True, "node_extension": {"id": "9", "affection_threshold": "高"}},
+    ],
+)
+def test_fused_turn_rejects_malformed_output(output):
+    agent = _agent(llm3=FakeLLM(output), affection=20)
+    with pytest.raises(ValueError):
+        asyncio.run(fused_turn(agent, 20, "1", "你好"))
+    assert (agent.affection, agent.current_node_id) == (20, "1")
+    assert set(agent.worldbook.blueprint.nodes) == {"1", "2", "3"}
+
+
+def test_fused_turn_takes_option_fast_path_with_single_roleplay_call(monkeypatch):
+    monkeypatch.setattr(gameplay, "UPDATE_COUNTERS", gameplay.Counter())
+    llm3 = FakeLLM(ROLEPLAY)
+    agent = _agent(llm3=llm3, affection=20)
+    agent.pending_options = {"陪她去天台": {"affection_delta": 15, "stage_effect": "关系拉近"}}
+
+    (affection, node_id, _, _), rp = asyncio.run(fused_turn(agent, 20, "1", "陪她去天台"))
+
+    assert (affection, node_id, agent.last_update_source) == (35, "2", "option")
+    assert rp["dialogue"] == "谢谢你陪我。"
+    # 走的是普通角色对话提示词，而不是带导演字段的合并提示词
+    assert len(llm3.prompts) == 1 and "is_custom_node" not in llm3.prompts[0]
+    assert gameplay.UPDATE_COUNTERS == {"option": 1}
@@ -0,0 +1,96 @@
+from typing import Dict, List, Tuple
+
+import pytest
+
+from ..backend import llm_router
+from ..backend.config import RoleModelSettings
+from ..backend.llm_router import MIN_SAMPLES, RoutedLLM
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def perf_counter(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+class FakeModel:
+    def __init__(self, model: str, clock: FakeClock, delays_s: List[float], fail: bool = False):
+        self.model = model
+        self.clock = clock
+        self.delays_s = delays_s
+        self.fail = fail
+        self.calls = 0
+
+    def call_with_usage(self, prompt: str) -> Tuple[str, Dict[str, int]]:
+        delay = self.delays_s[min(self.calls, len(self.delays_s) - 1)]
+        self.calls += 1
+        self.clock.now += delay
+        if self.fail:
+            raise RuntimeError("provider down")
+        return "{}", {"input_tokens": 10, "output_tokens": 5}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(llm_router, "time", fake)
+    return fake
+
+
+def _router(clock: FakeClock, primary: FakeModel, horizon_s: float = 300.0) -> RoutedLLM:
+    role = RoleModelSettings(
+        model="primary", temperature=0.7, max_tokens=0, fallback_model="fast", p95_threshold_ms=2000
+    )
+    router = RoutedLLM("llm2", role, window=50, horizon_s=horizon_s)
+    router.primary = primary  # type: ignore[assignment]
+    router.fallback = FakeModel("fast", clock, [0.2])  # type: ignore[assignment]
+    return router
+
+
+def test_single_cold_start_does_not_trigger_fallback(clock):
+    router = _router(clock, FakeModel("primary", clock, [9.0, 0.5]))
+    for _ in range(150):
+        router.call_with_usage("p")
+    assert router.fallback_routed == 0
+
+
+def test_sustained_slowness_falls_back_and_recovers_after_horizon(clock):
+    primary = FakeModel("primary", clock, [3.0] * MIN_SAMPLES + [0.5])
+    router = _router(clock, primary, horizon_s=300)
+    for _ in range(MIN_SAMPLES):
+        router.call_with_usage("p")
+    router.call_with_usage("p")
+    assert router.fallback_routed == 1
+
+    clock.now += 301
+    calls_before = primary.calls
+    router.call_with_usage("p")
+    assert primary.calls == calls_before + 1
+    assert router.fallback_routed == 1
+
+
+def test_failed_calls_do_not_count_toward_latency(clock):
+    primary = FakeModel("primary", clock, [9.0], fail=True)
+    router = _router(clock, primary)
+    for _ in range(MIN_SAMPLES + 5):
+        router.call_with_usage("p")
+    stats = router.stats["primary"]
+    assert stats.errors == MIN_SAMPLES + 5
+    assert len(stats.samples) == 0
+    # 每次都是主模型失败后改用降级模型，而不是因 p95 超阈值直接路由
+    assert router.snapshot()["fallback"]["calls"] == MIN_SAMPLES + 5
+
+
+def test_usage_sums_slots_and_prices_fallback_by_its_model(clock, monkeypatch):
+    monkeypatch.setattr(llm_router.settings, "llm_model_prices", {"primary": (1.0, 1.0), "fast": (0.1, 0.2)})
+    router = _router(clock, FakeModel("primary", clock, [0.5], fail=True))
+    router.call_with_usage("p")
+
+    calls, input_tokens, output_tokens, cost = router.usage()
+    assert (calls, input_tokens, output_tokens) == (2, 10, 5)
+    assert cost == pytest.approx((10 * 0.1 + 5 * 0.2) / 1000)
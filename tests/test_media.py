@@ -0,0 +1,104 @@
+import os
+import time
+
+from ..backend.services.media import STALE_TEMP_SECONDS, MediaStore
+
+
+SID_A = "a" * 32
+SID_B = "b" * 32
+SID_C = "c" * 32
+
+
+def _session(store: MediaStore, session_id: str, size: int, last_played: float) -> None:
+    path = store.path_for(session_id, f"scene_{session_id}_node_1_0.png")
+    path.write_bytes(b"x" * size)
+    os.utime(store.session_dir(session_id), (last_played, last_played))
+
+
+def test_collect_evicts_expired_sessions(tmp_path):
+    now = time.time()
+    store = MediaStore(tmp_path, ttl_seconds=3600)
+    _session(store, SID_A, 10, now - 7200)
+    _session(store, SID_B, 10, now - 60)
+
+    report = store.collect(now=now)
+
+    assert report.evicted_sessions == [SID_A]
+    assert report.freed_bytes == 10
+    assert not store.session_dir(SID_A).exists()
+    assert store.session_dir(SID_B).is_dir()
+
+
+def test_collect_quota_evicts_least_recently_played_and_respects_protect(tmp_path):
+    now = time.time()
+    store = MediaStore(tmp_path, quota_bytes=25)
+    _session(store, SID_A, 10, now - 300)
+    _session(store, SID_B, 10, now - 200)
+    _session(store, SID_C, 10, now - 100)
+
+    report = store.collect(protect=[SID_A], now=now)
+
+    assert report.evicted_sessions == [SID_B]
+    assert report.usage_bytes == 20
+    assert store.session_dir(SID_A).is_dir()
+    assert store.session_dir(SID_C).is_dir()
+
+
+def test_collect_without_quota_only_expires(tmp_path):
+    now = time.time()
+    store = MediaStore(tmp_path, quota_bytes=5, ttl_seconds=3600)
+    _session(store, SID_A, 10, now - 60)
+
+    report = store.collect(now=now, enforce_quota=False)
+
+    assert report.evicted_sessions == []
+    assert store.session_dir(SID_A).is_dir()
+
+
+def test_reconcile_migrates_legacy_files_and_removes_strays(tmp_path):
+    store = MediaStore(tmp_path)
+    (tmp_path / f"portrait_{SID_A}_0.png").write_bytes(b"p")
+    stale = tmp_path / "leftover.part"
+    stale.write_bytes(b"t")
+    os.utime(stale, (time.time() - 2 * STALE_TEMP_SECONDS,) * 2)
+    (tmp_path / "scene_index.jsonl").write_text("{}\n", encoding="utf-8")
+    _session(store, SID_B, 1, time.time())
+    (store.session_dir(SID_B) / f"scene_{SID_A}_node_1_0.png").write_bytes(b"wrong session")
+    writing = store.session_dir(SID_B) / f"scene_{SID_B}_node_2_0.png.abc123.part"
+    writing.write_bytes(b"in progress")
+
+    report = store.reconcile()
+
+    assert report.migrated_files == 1
+    assert report.removed_files == 2
+    assert store.resolve(f"portrait_{SID_A}_0.png") == store.session_dir(SID_A) / f"portrait_{SID_A}_0.png"
+    assert not stale.exists()
+    assert writing.exists()
+    assert (tmp_path / "scene_index.jsonl").exists()
+
+
+def test_reconcile_removes_sessions_not_live_and_protects_live(tmp_path):
+    now = time.time()
+    store = MediaStore(tmp_path, quota_bytes=1)
+    _session(store, SID_A, 10, now)
+    _session(store, SID_B, 10, now)
+
+    report = store.reconcile(live=[SID_A])
+
+    assert report.removed_dirs >= 1
+    assert not store.session_dir(SID_B).exists()
+    assert store.session_dir(SID_A).is_dir()
+    assert report.evicted_sessions == []
+
+
+def test_reconcile_dry_run_changes_nothing(tmp_path):
+    store = MediaStore(tmp_path, ttl_seconds=1)
+    (tmp_path / f"portrait_{SID_A}_0.png").write_bytes(b"p")
+    _session(store, SID_B, 10, time.time() - 3600)
+
+    report = store.reconcile(live=[], dry_run=True)
+
+    assert report.migrated_files == 1
+    assert report.removed_dirs == 1
+    assert (tmp_path / f"portrait_{SID_A}_0.png").exists()
+    assert store.session_dir(SID_B).is_dir()
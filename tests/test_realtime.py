@@ -0,0 +1,25 @@
+from ..backend.services.realtime import EventHub
+
+
+def test_expire_drops_idle_logs_without_connections():
+    hub = EventHub(log_size=10)
+    hub.publish("idle", "turn", {})
+    hub.publish("active", "turn", {})
+    hub.connections["connected"] = set()
+    hub.publish("connected", "turn", {})
+    hub.logs["idle"].last_active -= 120
+    hub.logs["connected"].last_active -= 120
+
+    assert hub.expire(idle_seconds=60) == 1
+    assert set(hub.logs) == {"active", "connected"}
+
+
+def test_gap_detection():
+    hub = EventHub(log_size=3)
+    for _ in range(5):
+        hub.publish("s", "turn", {})
+    log = hub.log("s")
+    assert not log.has_gap(0)
+    assert not log.has_gap(2)
+    assert log.has_gap(1)
+    assert log.has_gap(9)
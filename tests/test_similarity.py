@@ -0,0 +1,51 @@
+from ..backend.services import similarity
+from ..backend.services.media import MediaStore
+from ..backend.services.similarity import SceneIndex, scene_conditions
+
+
+SID_A = "a" * 32
+SID_B = "b" * 32
+
+
+def _scene(store: MediaStore, session_id: str) -> str:
+    name = f"scene_{session_id}_node_1_0.png"
+    store.path_for(session_id, name).write_bytes(b"x")
+    return name
+
+
+def test_scene_conditions_separate_time_of_day_and_merge_synonyms():
+    assert scene_conditions("雨夜的老街餐馆，暖黄灯光") == "night+rain"
+    assert scene_conditions("清晨的老街餐馆，暖黄灯光") == "dawn"
+    assert scene_conditions("黄昏的天台") == scene_conditions("傍晚的天台") == "dusk"
+    assert scene_conditions("老街餐馆") == "-"
+
+
+def test_lookup_only_within_namespace(tmp_path, monkeypatch):
+    store = MediaStore(tmp_path / "media")
+    monkeypatch.setattr(similarity, "MEDIA_STORE", store)
+    index = SceneIndex(tmp_path / "index.jsonl", threshold=0.8)
+    text = "雨夜的老街餐馆，暖黄灯光下的木桌"
+    index.add("ns|night+rain", text, store.path_for(SID_A, _scene(store, SID_A)))
+
+    hit = index.lookup("ns|night+rain", text)
+    assert hit is not None and hit[0].name == f"scene_{SID_A}_node_1_0.png"
+    assert index.lookup("ns|dawn", text) is None
+
+
+def test_compact_drops_entries_whose_files_were_collected(tmp_path, monkeypatch):
+    store = MediaStore(tmp_path / "media")
+    monkeypatch.setattr(similarity, "MEDIA_STORE", store)
+    index = SceneIndex(tmp_path / "index.jsonl", threshold=0.8)
+    index.add("ns", "老街餐馆", store.path_for(SID_A, _scene(store, SID_A)))
+    index.add("ns", "海边小屋", store.path_for(SID_B, _scene(store, SID_B)))
+    store.path_for(SID_A, f"scene_{SID_A}_node_1_0.png").unlink()
+
+    assert index.compact() == 1
+    assert [e.text for e in index.entries] == ["海边小屋"]
+    assert index.lookup("ns", "海边小屋") is not None
+
+    reloaded = SceneIndex(tmp_path / "index.jsonl", threshold=0.8)
+    assert reloaded.lookup("ns", "海边小屋") is not None
+    reloaded._load()
+    assert len(reloaded.entries) == 1
+    assert index.compact() == 0
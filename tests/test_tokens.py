@@ -0,0 +1,117 @@
+import base64
+import json
+import zlib
+
+import pytest
+
+from ..backend.services import tokens
+from ..backend.services.tokens import (
+    SessionTokenCodec,
+    SessionTokenError,
+    check_session_mode,
+    parse_keys,
+)
+
+
+SID = "0" * 32
+
+
+def _session() -> dict:
+    return {
+        "state": {"worldbook": {"世界观": "老街"}, "affection": 42, "current_node_id": "2", "pending_options": {}},
+        "portrait_path": f"generated/00/{SID}/portrait_{SID}_0.png",
+        "scene_paths": {"2": f"generated/00/{SID}/scene_{SID}_node_2_0.png"},
+        "scene_url": f"/media/scene_{SID}_node_2_0.png",
+        "final_cg_url": "",
+        "rev": 3,
+    }
+
+
+def _codec(keys: str = "k1:secret-one", max_bytes: int = 32768, ttl: float = 0) -> SessionTokenCodec:
+    return SessionTokenCodec(parse_keys(keys), max_bytes=max_bytes, ttl_seconds=ttl)
+
+
+def test_round_trip_restores_state_and_media_names():
+    codec = _codec()
+    session_id, session = codec.decode(codec.encode(SID, _session()))
+    assert session_id == SID
+    assert session["state"]["affection"] == 42
+    assert session["rev"] == 3
+    assert session["scene_url"] == f"/media/scene_{SID}_node_2_0.png"
+
+
+def test_tampered_payload_is_rejected():
+    codec = _codec()
+    kid, body, mac = codec.encode(SID, _session()).split(".")
+    raw = json.loads(zlib.decompress(base64.urlsafe_b64decode(body + "=" * (-len(body) % 4))))
+    raw["s"]["st"]["affection"] = 100
+    forged = base64.urlsafe_b64encode(zlib.compress(json.dumps(raw).encode())).rstrip(b"=").decode()
+    with pytest.raises(SessionTokenError):
+        codec.decode(f"{kid}.{forged}.{mac}")
+
+
+def test_key_rotation_accepts_old_tokens_and_signs_with_new_key():
+    old = _codec("k1:secret-one")
+    rotated = _codec("k2:secret-two,k1:secret-one")
+    assert rotated.decode(old.encode(SID, _session()))[0] == SID
+    assert rotated.encode(SID, _session()).startswith("k2.")
+    with pytest.raises(SessionTokenError):
+        _codec("k2:secret-two").decode(old.encode(SID, _session()))
+
+
+def test_same_kid_with_different_secret_is_rejected():
+    token = _codec("k1:secret-one").encode(SID, _session())
+    with pytest.raises(SessionTokenError):
+        _codec("k1:other-secret").decode(token)
+
+
+def test_size_limit_applies_to_encode_and_decode():
+    token = _codec().encode(SID, _session())
+    small = _codec(max_bytes=len(token) - 1)
+    with pytest.raises(SessionTokenError):
+        small.encode(SID, _session())
+    with pytest.raises(SessionTokenError):
+        small.decode(token)
+
+
+def test_decompression_is_capped():
+    codec = _codec(max_bytes=1024)
+    payload = {"v": tokens.TOKEN_VERSION, "sid": SID, "iat": 0, "s": {"st": {}, "pad": "a" * (1024 * 80)}}
+    body = zlib.compress(json.dumps(payload).encode(), 9)
+    token = f"k1.{tokens._b64encode(body)}.{tokens._b64encode(codec._mac('k1', body))}"
+    assert len(token) <= 1024
+    with pytest.raises(SessionTokenError, match="解压后过大"):
+        codec.decode(token)
+
+
+def test_expired_token_is_rejected(monkeypatch):
+    codec = _codec(ttl=60)
+    token = codec.encode(SID, _session())
+    monkeypatch.setattr(tokens.time, "time", lambda: 10**12)
+    with pytest.raises(SessionTokenError, match="过期"):
+        codec.decode(token)
+
+
+def test_malformed_token_is_rejected():
+    with pytest.raises(SessionTokenError):
+        _codec().decode("not-a-token")
+
+
+def test_encode_without_keys_fails():
+    with pytest.raises(SessionTokenError):
+        SessionTokenCodec([], max_bytes=1024, ttl_seconds=0).encode(SID, _session())
+
+
+def test_parse_keys_rejects_malformed_entries():
+    with pytest.raises(ValueError):
+        parse_keys("no-secret")
+    assert parse_keys(" a:1 , b:2 ") == [("a", b"1"), ("b", b"2")]
+
+
+def test_session_mode_is_validated_at_startup():
+    check_session_mode("memory", SessionTokenCodec([], max_bytes=1024, ttl_seconds=0))
+    check_session_mode("token", _codec())
+    with pytest.raises(ValueError):
+        check_session_mode("tokens", _codec())
+    with pytest.raises(ValueError):
+        check_session_mode("token", SessionTokenCodec([], max_bytes=1024, ttl_seconds=0))